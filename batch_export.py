@@ -0,0 +1,110 @@
+"""
+Export personnalisé : un classeur par référent MOA ou par catégorie, livrés dans un ZIP.
+
+Chaque partition est rendue dans le modèle Excel habituel (to_simple / to_excel)
+par un pool de processus : openpyxl (chargement du modèle, écriture cellule par
+cellule) ne libère pas le GIL, des threads n'iraient pas plus vite. Le pool est
+créé une fois par processus serveur ; ses workers partent d'un processus
+« forkserver » qui a déjà importé sourcing_core, le démarrage coûte donc un
+fork et non un import complet.
+
+Les classeurs sont écrits dans le ZIP au fil de leur achèvement : quelques
+dizaines de fichiers personnalisés prennent à peu près le temps d'un seul.
+"""
+import multiprocessing as mp
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from io import BytesIO
+
+import pandas as pd
+
+from category_index import CategoryIndex
+
+PARTITION_COLUMNS = {"Référent MOA": "Référent MOA", "Catégorie": "Catégories"}
+EMPTY_LABEL = "Sans référent"
+WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+MIN_PARALLEL = 3        # en deçà, le rendu en série évite de réveiller le pool
+
+
+def partitions(df: pd.DataFrame, by="Référent MOA"):
+    """
+    [(libellé, sous-tableau)] selon `by` ("Référent MOA" ou "Catégorie").
+    Par catégorie, un fournisseur multi-catégories figure dans chaque fichier concerné.
+    """
+    col = PARTITION_COLUMNS[by]
+    if col not in df:
+        return []
+    df = df.reset_index(drop=True)
+    if col == "Catégories":
+        return [(label, df.take(rows)) for label, rows in CategoryIndex.from_series(df[col]).partitions()]
+    keys = df[col].astype("object").where(df[col].notna(), "").astype(str).str.strip()
+    return [(label or EMPTY_LABEL, part) for label, part in df.groupby(keys.to_numpy(), sort=True)]
+
+
+def _file_name(label: str, prefix: str, used: set) -> str:
+    base = re.sub(r"[^\w\- ]+", "_", label).strip(" _")[:60] or "sans_nom"
+    name, i = f"{prefix}_{base}.xlsx", 2
+    while name.casefold() in used:
+        name = f"{prefix}_{base} ({i}).xlsx"
+        i += 1
+    used.add(name.casefold())
+    return name
+
+
+def render_partition(kind: str, part: pd.DataFrame) -> bytes:
+    """Classeur d'une partition dans le modèle ("simple" ou "complet"). Exécuté dans un worker."""
+    from sourcing_core import to_excel, to_simple
+    bio = to_simple(part) if kind == "simple" else to_excel(part)
+    return bio.getvalue()
+
+
+@lru_cache(maxsize=1)
+def _pool() -> ProcessPoolExecutor:
+    methods = mp.get_all_start_methods()
+    if "forkserver" in methods:
+        ctx = mp.get_context("forkserver")
+        ctx.set_forkserver_preload(["sourcing_core"])
+    else:
+        ctx = mp.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=WORKERS, mp_context=ctx)
+
+
+def export_zip(df: pd.DataFrame, by="Référent MOA", kind="simple", prefix="MOA", progress=None):
+    """
+    ZIP (BytesIO) d'un classeur par partition. progress(fait, total) est appelé
+    à chaque fichier ajouté.
+    """
+    parts = partitions(df, by)
+    used = set()
+    names = [_file_name(label, prefix, used) for label, _ in parts]
+    bio = BytesIO()
+    # .xlsx est déjà compressé : stocker sans recompresser
+    with zipfile.ZipFile(bio, "w", compression=zipfile.ZIP_STORED) as zf:
+        if WORKERS < 2 or len(parts) < MIN_PARALLEL:
+            for i, (name, (_, part)) in enumerate(zip(names, parts), start=1):
+                zf.writestr(name, render_partition(kind, part))
+                if progress is not None:
+                    progress(i, len(parts))
+        else:
+            todo = dict(zip(names, (part for _, part in parts)))
+            try:
+                futures = {_pool().submit(render_partition, kind, part): name for name, part in todo.items()}
+                for fut in as_completed(futures):
+                    zf.writestr(futures[fut], fut.result())
+                    del todo[futures[fut]]
+                    if progress is not None:
+                        progress(len(parts) - len(todo), len(parts))
+            except BrokenProcessPool as e:
+                print(f"⚠️ Pool d'export interrompu ({e}) : rendu en série des {len(todo)} fichier(s) restant(s)")
+                _pool.cache_clear()
+                for name, part in list(todo.items()):
+                    zf.writestr(name, render_partition(kind, part))
+                    del todo[name]
+                    if progress is not None:
+                        progress(len(parts) - len(todo), len(parts))
+    bio.seek(0)
+    return bio
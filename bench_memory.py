@@ -0,0 +1,164 @@
+"""
+Banc mémoire : représentation historique (tout en objets Python via astype(str),
+toutes les colonnes conservées, résultat assemblé ligne à ligne en dicts) contre la
+représentation compacte de sourcing_core (colonnes utiles seulement, chaînes
+Arrow, catégoriels, assemblage en colonnes).
+
+Chaque variante tourne dans un sous-processus séparé pour mesurer son pic RSS.
+
+    python bench_memory.py --rows 50000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+CATEGORIES = ["Bois", "Isolation", "Menuiserie", "Bardage", "Béton bas carbone",
+              "CVC", "Façade", "Couverture", "Plâtrerie", "Électricité"]
+VILLES = [("75011", "Paris"), ("69003", "Lyon"), ("33000", "Bordeaux"), ("40300", "Hastingues"),
+          ("59000", "Lille"), ("1460", "Ittre, Belgique"), ("44000", "Nantes"), ("67000", "Strasbourg")]
+NOISE_COLUMNS = ["Description", "Site web", "Effectif", "Chiffre d'affaires", "SIRET", "Labels",
+                 "Commentaires", "Date de création", "Produits", "Certifications"]
+
+
+def make_csv(path, rows, seed=0):
+    """Export synthétique au format de la base (séparateur ';')."""
+    rnd = random.Random(seed)
+    header = ["Raison sociale", "Catégories", "Référent MOA", "Email référent", "Adresse",
+              "adresse-du-siège", "implant-indus-2", "implant-indus-3", "Contact tech",
+              "Contact dirigeant", "Contacts"] + NOISE_COLUMNS
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(";".join(header) + "\n")
+        for i in range(rows):
+            cp, ville = rnd.choice(VILLES)
+            cats = ", ".join(rnd.sample(CATEGORIES, rnd.randint(1, 3)))
+            ref = rnd.choice(["Jean Dupont", "Marie Curie", "Paul Martin", ""])
+            row = [
+                f"Fournisseur {i}", cats, ref, "",
+                f"{rnd.randint(1, 200)} rue de la Paix {cp} {ville}",
+                f"{rnd.randint(1, 200)} avenue du Siège {cp} {ville}",
+                rnd.choice(["", f"ZI Nord {cp} {ville}"]), "",
+                f"tech{i}@fournisseur{i}.fr", f"dir{i}@fournisseur{i}.fr", "",
+            ] + ["x" * rnd.randint(5, 60) for _ in NOISE_COLUMNS]
+            f.write(";".join(row) + "\n")
+
+
+def run_legacy(path):
+    """Reproduction de l'ancien pipeline (référence)."""
+    import pandas as pd
+    from sourcing_core import _find_columns, choose_contact_moa
+
+    df = pd.read_csv(path, sep=None, engine="python")
+    colmap = _find_columns(df.columns)
+    out = pd.DataFrame()
+    out["Raison sociale"] = df[colmap["raison"]].astype(str).fillna("")
+    out["Référent MOA"] = df[colmap["referent"]].astype(str).fillna("")
+    out["Catégories"] = df[colmap["categorie"]].astype(str).fillna("")
+    out["Adresse"] = df[colmap["adresse"]].astype(str).fillna("")
+    out["Contact MOA"] = df.apply(lambda r: choose_contact_moa(r, colmap), axis=1)
+    for c in df.columns:
+        cl = str(c).lower()
+        if ("implant" in cl and "indus" in cl) or ("siège" in cl) or ("siege" in cl):
+            out[c] = df[c].astype(str).fillna("")
+
+    rows = []
+    for _, row in out.iterrows():
+        rows.append({
+            "Raison sociale": row["Raison sociale"], "Pays": "France", "Adresse": row["Adresse"],
+            "Code postal": "75011", "Distance au projet": 12.3, "Catégories": row["Catégories"],
+            "Référent MOA": row["Référent MOA"], "Contact MOA": row["Contact MOA"],
+            "Type de distance": "API OSRM", "Fiabilité géocode": "indus",
+            "Latitude": 48.85, "Longitude": 2.35,
+        })
+    res = pd.DataFrame(rows)
+    return df, out, res
+
+
+def run_compact(path):
+    from sourcing_core import RESULT_COLUMNS, process_csv_to_df, typed_result_frame
+
+    out = process_csv_to_df(path)
+    n = len(out)
+    result = {c: [] for c in RESULT_COLUMNS}
+    result["Raison sociale"] = out["Raison sociale"].tolist()
+    result["Pays"] = ["France"] * n
+    result["Adresse"] = out["Adresse"].tolist()
+    result["Code postal"] = ["75011"] * n
+    result["Distance au projet"] = [12.3] * n
+    result["Catégories"] = out["Catégories"].tolist()
+    result["Référent MOA"] = out["Référent MOA"].tolist()
+    result["Contact MOA"] = out["Contact MOA"].tolist()
+    result["Type de distance"] = ["API OSRM"] * n
+    result["Fiabilité géocode"] = ["indus"] * n
+    result["Latitude"] = [48.85] * n
+    result["Longitude"] = [2.35] * n
+    res = typed_result_frame(result)
+    return None, out, res
+
+
+def _child(variant, path):
+    import sourcing_core  # noqa: F401  (même coût d'import pour les deux variantes)
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    raw, out, res = (run_legacy if variant == "legacy" else run_compact)(path)
+    elapsed = time.perf_counter() - t0
+    mb = lambda frame: 0.0 if frame is None else frame.memory_usage(deep=True).sum() / 2**20
+    print(json.dumps({
+        "variant": variant,
+        "seconds": round(elapsed, 2),
+        "raw_mb": round(mb(raw), 1),
+        "base_mb": round(mb(out), 1),
+        "result_mb": round(mb(res), 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "import_rss_mb": round(start_rss / 1024, 1),
+    }))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=50000)
+    ap.add_argument("--csv", help="CSV existant à mesurer (sinon export synthétique)")
+    ap.add_argument("--child", nargs=2, metavar=("VARIANT", "CSV"), help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        _child(*args.child)
+        return
+
+    path = args.csv
+    tmp = None
+    if not path:
+        tmp = tempfile.NamedTemporaryFile(suffix=".csv", delete=False)
+        tmp.close()
+        path = tmp.name
+        make_csv(path, args.rows)
+    try:
+        results = {}
+        for variant in ("legacy", "compact"):
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", variant, path],
+                                  capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            if proc.returncode:
+                sys.exit(proc.stderr)
+            results[variant] = json.loads(proc.stdout.strip().splitlines()[-1])
+    finally:
+        if tmp:
+            os.unlink(path)
+
+    keys = ["seconds", "raw_mb", "base_mb", "result_mb", "peak_rss_mb"]
+    print(f"{'':>10} " + " ".join(f"{k:>12}" for k in keys))
+    for variant, r in results.items():
+        print(f"{variant:>10} " + " ".join(f"{r[k]:>12}" for k in keys))
+    leg, com = results["legacy"], results["compact"]
+    grow = lambda r: r["peak_rss_mb"] - r["import_rss_mb"]
+    if grow(leg) > 0:
+        print(f"\nPic mémoire du pipeline (hors imports) : {grow(leg):.0f} Mo -> {grow(com):.0f} Mo "
+              f"({100 * (1 - grow(com) / grow(leg)):.0f} % de moins)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Construit le gazetier hors ligne utilisé par commune_index.py.
+
+Source : fichiers "postal codes" de GeoNames (https://download.geonames.org/export/zip/),
+un par pays (FR.zip, BE.zip, LU.zip... ou les .txt extraits).
+
+    python build_gazetteer.py FR.zip BE.zip LU.zip
+    python build_gazetteer.py FR.txt BE.txt LU.txt -o data/communes_fr_be_lu.csv
+
+Index inverse (pays / code postal depuis les coordonnées, cf. reverse_index.py),
+avec tous les pays fournisseurs :
+
+    python build_gazetteer.py FR.zip BE.zip LU.zip NL.zip ES.zip IT.zip CH.zip DE.zip PT.zip SK.zip -o data/postcodes.csv
+"""
+import argparse
+import csv
+import io
+import os
+import zipfile
+
+from commune_index import GAZETTEER_PATH
+from reverse_index import COUNTRY_NAMES
+
+
+def _read_lines(path):
+    if path.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            name = next(n for n in zf.namelist() if n.lower().endswith(".txt") and "readme" not in n.lower())
+            with zf.open(name) as f:
+                yield from io.TextIOWrapper(f, encoding="utf-8")
+    else:
+        with open(path, encoding="utf-8") as f:
+            yield from f
+
+
+def iter_geonames(path):
+    """(pays, code_postal, commune, lat, lon) pour chaque ligne d'un dump GeoNames."""
+    for line in _read_lines(path):
+        cols = line.rstrip("\n").split("\t")
+        if len(cols) < 11 or not cols[9] or not cols[10]:
+            continue
+        code, cp, commune = cols[0], cols[1], cols[2]
+        yield COUNTRY_NAMES.get(code, code), cp, commune, round(float(cols[9]), 5), round(float(cols[10]), 5)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("sources", nargs="+", help="dumps GeoNames (.zip ou .txt)")
+    ap.add_argument("-o", "--output", default=GAZETTEER_PATH)
+    args = ap.parse_args(argv)
+
+    seen, rows = set(), []
+    for src in args.sources:
+        for rec in iter_geonames(src):
+            key = (rec[0], rec[1], rec[2].lower())
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append(rec)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["pays", "code_postal", "commune", "lat", "lon"])
+        w.writerows(rows)
+    print(f"✅ {len(rows)} communes écrites dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Index inversé des catégories fournisseurs.
+
+La colonne "Catégories" reste une cellule texte libre par fournisseur
+("Menuiserie; Bardage, Isolation"). On la découpe une seule fois en jetons et on
+garde, pour chaque catégorie, les positions des lignes concernées sous forme de
+tableaux d'entiers compacts. Les filtres multi-catégories et les exports par
+catégorie se font ensuite par union/intersection de ces tableaux, sans rescanner
+la colonne.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+SPLIT_RE = re.compile(r"\s*[;,|\n]\s*")
+EMPTY_TOKENS = {"", "nan", "none", "-"}
+SHEET_FORBIDDEN_RE = re.compile(r"[\[\]\:\*\?\/\\]")
+
+
+def split_categories(cell) -> list:
+    """Découpe une cellule "Catégories" en libellés (ordre conservé, sans doublon)."""
+    if cell is None or (isinstance(cell, float) and pd.isna(cell)):
+        return []
+    seen, out = set(), []
+    for tok in SPLIT_RE.split(str(cell)):
+        tok = re.sub(r"\s+", " ", tok).strip(" .")
+        key = tok.casefold()
+        if key in EMPTY_TOKENS or key in seen:
+            continue
+        seen.add(key)
+        out.append(tok)
+    return out
+
+
+class CategoryIndex:
+    """Catégorie -> positions (np.int32, triées) des lignes du DataFrame indexé."""
+
+    def __init__(self, postings: dict, labels: dict, n_rows: int):
+        self._postings = postings   # clé normalisée -> np.ndarray[int32]
+        self._labels = labels       # clé normalisée -> libellé affiché
+        self.n_rows = n_rows
+
+    @classmethod
+    def from_series(cls, series) -> "CategoryIndex":
+        buckets, labels = {}, {}
+        for pos, cell in enumerate(series.tolist() if hasattr(series, "tolist") else series):
+            for tok in split_categories(cell):
+                key = tok.casefold()
+                labels.setdefault(key, tok)
+                buckets.setdefault(key, []).append(pos)
+        postings = {k: np.asarray(v, dtype=np.int32) for k, v in buckets.items()}
+        return cls(postings, labels, len(series))
+
+    def __len__(self):
+        return len(self._postings)
+
+    def __contains__(self, category):
+        return str(category).casefold() in self._postings
+
+    def categories(self) -> list:
+        """Libellés triés par nombre de fournisseurs décroissant puis alphabétique."""
+        keys = sorted(self._postings, key=lambda k: (-len(self._postings[k]), k))
+        return [self._labels[k] for k in keys]
+
+    def counts(self) -> dict:
+        return {self._labels[k]: len(v) for k, v in self._postings.items()}
+
+    def rows(self, categories, match: str = "any") -> np.ndarray:
+        """
+        Positions des lignes portant les catégories demandées.
+        match="any" : au moins une (union) ; match="all" : toutes (intersection).
+        """
+        arrays = [self._postings.get(str(c).casefold(), np.empty(0, dtype=np.int32)) for c in categories]
+        if not arrays:
+            return np.arange(self.n_rows, dtype=np.int32)
+        if len(arrays) == 1:
+            return arrays[0]
+        if match == "all":
+            out = arrays[0]
+            for a in arrays[1:]:
+                out = np.intersect1d(out, a, assume_unique=True)
+            return out
+        return np.unique(np.concatenate(arrays))
+
+    def mask(self, categories, match: str = "any") -> np.ndarray:
+        m = np.zeros(self.n_rows, dtype=bool)
+        m[self.rows(categories, match)] = True
+        return m
+
+    def partitions(self):
+        """Itère (libellé, positions) pour chaque catégorie, dans l'ordre de categories()."""
+        for label in self.categories():
+            yield label, self._postings[label.casefold()]
+
+
+def _sheet_name(label: str, used: set) -> str:
+    base = SHEET_FORBIDDEN_RE.sub(" ", label).strip("' ")[:31] or "Sans nom"
+    name, i = base, 2
+    while name.casefold() in used:
+        suffix = f" ({i})"
+        name = base[:31 - len(suffix)] + suffix
+        i += 1
+    used.add(name.casefold())
+    return name
+
+
+def write_category_sheets(writer, df: pd.DataFrame, index: CategoryIndex, autofit=None, reserved=()):
+    """
+    Écrit une feuille par catégorie dans un pd.ExcelWriter déjà ouvert, en une
+    seule passe sur l'index (df.take par catégorie, aucun masque booléen).
+    `autofit(ws, frame)` est appelé sur chaque feuille si fourni.
+    """
+    used = {str(r).casefold() for r in reserved}
+    for label, rows in index.partitions():
+        part = df.take(rows)
+        name = _sheet_name(label, used)
+        part.to_excel(writer, index=False, sheet_name=name)
+        if autofit is not None:
+            autofit(writer.sheets[name], part)
@@ -0,0 +1,189 @@
+"""
+Résolution hors ligne des communes FR/BE/LU par index de trigrammes.
+
+Le gazetier (data/communes_fr_be_lu.csv : pays, code_postal, commune, lat, lon)
+est généré par build_gazetteer.py. Les noms sont normalisés (accents, tirets,
+apostrophes, "St"/"Ste" -> "Saint"/"Sainte", "Cedex") puis découpés en
+trigrammes ; chaque trigramme pointe vers les identifiants de noms qui le
+contiennent. Une recherche compte les trigrammes communs (np.bincount), en déduit
+un score de Dice, et combine ce score avec la concordance du code postal pour
+produire une confiance entre 0 et 1.
+"""
+import csv
+import math
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "communes_fr_be_lu.csv")
+
+ABBREVIATIONS = {"st": "saint", "ste": "sainte", "sts": "saints", "stes": "saintes", "s": "sur"}
+NOISE_RE = re.compile(r"\bcedex\b.*$")
+
+
+def normalize_commune(name) -> str:
+    """'St-Étienne-du-Rouvray Cedex 3' -> 'saint etienne du rouvray'."""
+    s = unicodedata.normalize("NFKD", str(name or ""))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    s = NOISE_RE.sub("", s)
+    s = re.sub(r"[’'`\-_/.,()]", " ", s)
+    s = re.sub(r"[^a-z0-9 ]", "", s)
+    words = [ABBREVIATIONS.get(w, w) for w in s.split()]
+    return " ".join(words)
+
+
+def trigrams(norm: str) -> set:
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _km(lat1, lon1, lat2, lon2):
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371.0 * math.hypot(x, y)
+
+
+class CommuneResolver:
+    """Index en mémoire : noms normalisés, entrées (cp, pays, lat, lon) et trigrammes."""
+
+    def __init__(self, records):
+        names, name_ids = [], {}
+        self.entries_by_name = []       # name_id -> [entry_id, ...]
+        self.entries_by_cp = {}         # cp -> [entry_id, ...]
+        self.cp, self.country, lat, lon = [], [], [], []
+        for country, cp, commune, la, lo in records:
+            norm = normalize_commune(commune)
+            if not norm:
+                continue
+            nid = name_ids.get(norm)
+            if nid is None:
+                nid = name_ids[norm] = len(names)
+                names.append(norm)
+                self.entries_by_name.append([])
+            eid = len(self.cp)
+            self.cp.append(str(cp))
+            self.country.append(country)
+            lat.append(float(la))
+            lon.append(float(lo))
+            self.entries_by_name[nid].append(eid)
+            self.entries_by_cp.setdefault(str(cp).upper(), []).append(eid)
+        self.names = names
+        self.name_ids = name_ids
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+
+        buckets = {}
+        gram_len = np.zeros(len(names), dtype=np.int32)
+        for nid, norm in enumerate(names):
+            grams = trigrams(norm)
+            gram_len[nid] = len(grams)
+            for g in grams:
+                buckets.setdefault(g, []).append(nid)
+        self.postings = {g: np.asarray(v, dtype=np.int32) for g, v in buckets.items()}
+        self.gram_len = gram_len
+
+    def __len__(self):
+        return len(self.cp)
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = [(r["pays"], r["code_postal"], r["commune"], r["lat"], r["lon"]) for r in csv.DictReader(f)]
+        return cls(rows)
+
+    # ------------------------------------------------------------------
+    def _candidates(self, norm, limit=10):
+        """[(name_id, dice)] des noms les plus proches, meilleurs d'abord."""
+        nid = self.name_ids.get(norm)
+        if nid is not None:
+            return [(nid, 1.0)]
+        grams = trigrams(norm)
+        hits = [self.postings[g] for g in grams if g in self.postings]
+        if not hits:
+            return []
+        counts = np.bincount(np.concatenate(hits), minlength=len(self.names))
+        cand = np.nonzero(counts)[0]
+        dice = 2.0 * counts[cand] / (len(grams) + self.gram_len[cand])
+        order = np.argsort(-dice, kind="stable")[:limit]
+        return [(int(cand[i]), float(dice[i])) for i in order]
+
+    def _pick(self, eids, countries):
+        if countries:
+            eids = [e for e in eids if self.country[e] in countries]
+        return eids
+
+    def _spread_km(self, eids):
+        la, lo = self.lat[eids], self.lon[eids]
+        return max(_km(la[0], lo[0], a, b) for a, b in zip(la, lo)) if len(eids) > 1 else 0.0
+
+    def _result(self, eids, confidence, cp=None):
+        """Centroïde des entrées retenues -> (lat, lon, pays, cp, confiance)."""
+        e0 = eids[0]
+        return (float(self.lat[eids].mean()), float(self.lon[eids].mean()),
+                self.country[e0], cp or self.cp[e0], round(confidence, 3))
+
+    def resolve(self, ville="", cp="", countries=None):
+        """
+        Résout une commune (nom éventuellement mal orthographié) et/ou un code
+        postal. Renvoie (lat, lon, pays, cp, confiance) ou None.
+        """
+        norm = normalize_commune(ville)
+        cp = str(cp or "").strip().upper()
+        by_cp = self._pick(self.entries_by_cp.get(cp, []), countries) if cp else []
+
+        # Code postal connu : on cherche le meilleur nom parmi ses communes
+        if by_cp:
+            if not norm:
+                spread = self._spread_km(by_cp)
+                return self._result(by_cp, 0.9 if spread <= 15 else 0.7, cp)
+            best, best_score = None, 0.0
+            for e in by_cp:
+                cand = self.names[self._name_of(e)]
+                score = 1.0 if cand == norm else _dice(trigrams(norm), trigrams(cand))
+                if score > best_score:
+                    best, best_score = e, score
+            if best is not None and best_score >= 0.5:
+                return self._result([best], min(1.0, best_score + 0.25), cp)
+
+        if not norm:
+            return None
+
+        # Nom seul (ou CP incohérent) : recherche floue sur tout l'index
+        for nid, score in self._candidates(norm):
+            eids = self._pick(self.entries_by_name[nid], countries)
+            if not eids:
+                continue
+            if cp and by_cp:
+                score *= 0.8                       # nom trouvé mais CP contradictoire
+            if self._spread_km(eids) > 20:
+                score *= 0.75                      # homonymes éloignés (ex. Saint-Martin)
+                eids = eids[:1]
+            return self._result(eids, score)
+        return None
+
+    def _name_of(self, eid):
+        if not hasattr(self, "_name_by_entry"):
+            arr = np.empty(len(self.cp), dtype=np.int32)
+            for nid, eids in enumerate(self.entries_by_name):
+                arr[eids] = nid
+            self._name_by_entry = arr
+        return int(self._name_by_entry[eid])
+
+
+def _dice(a: set, b: set) -> float:
+    return 2.0 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+
+@lru_cache(maxsize=1)
+def get_resolver(path=GAZETTEER_PATH):
+    """Résolveur partagé (chargé une fois par processus) ; None si le gazetier est absent."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return CommuneResolver.from_csv(path)
+    except Exception as e:
+        print(f"⚠️ Gazetier illisible ({path}) : {e}")
+        return None
@@ -0,0 +1,126 @@
+"""
+Échelle de repli apprise pour le géocodage.
+
+Pour chaque "forme" d'adresse (rue + CP + ville, CP + ville, ville seule, ...)
+on compte, variante par variante (requête structurée, texte complet, commune,
+CP...), le nombre d'essais et de succès. L'ordre des variantes suit ensuite le
+taux de succès lissé, et une variante qui n'a jamais abouti après suffisamment
+d'essais est sautée (sauf une adresse sur EXPLORE_EVERY, pour pouvoir revenir
+en grâce après une panne passagère). Les statistiques sont persistées en JSON
+entre deux runs.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+from functools import lru_cache
+
+MIN_TRIES_BEFORE_SKIP = 20
+EXPLORE_EVERY = 50          # une variante sautée est quand même retentée de temps en temps
+AUTOSAVE_EVERY = 50
+_SAVE_LOCK = threading.Lock()     # sessions et tâches du même serveur écrivent le même fichier
+
+
+def address_shape(street: str, cp: str, ville: str, overseas: bool) -> str:
+    """Signature grossière d'une adresse, clé des statistiques."""
+    parts = [p for p, present in (("rue", street), ("cp", cp), ("ville", ville)) if present]
+    shape = "+".join(parts) or "autre"
+    return shape + ("/etranger" if overseas else "")
+
+
+class LadderStats:
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = 0
+        self.counts = {}        # forme -> variante -> [essais, succès]
+        self.resolved = 0       # adresses passées par l'échelle
+        self.calls = 0          # requêtes réseau correspondantes
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                self.counts = data.get("counts", {})
+                self.resolved = data.get("resolved", 0)
+                self.calls = data.get("calls", 0)
+            except Exception as e:
+                print(f"⚠️ Statistiques de géocodage illisibles ({path}) : {e}")
+
+    def order(self, shape: str, variants: list) -> list:
+        """Variantes triées par taux de succès lissé ; celles qui échouent toujours sont retirées."""
+        with self._lock:
+            stats = self.counts.get(shape, {})
+            kept = []
+            for rank, v in enumerate(variants):
+                tries, ok = stats.get(v, [0, 0])
+                if tries >= MIN_TRIES_BEFORE_SKIP and ok == 0 and self.resolved % EXPLORE_EVERY:
+                    continue
+                kept.append(((ok + 1) / (tries + 2), -rank, v))
+        kept.sort(reverse=True)
+        return [v for _, _, v in kept]
+
+    def record(self, shape: str, variant: str, success: bool):
+        """Une requête réseau réellement envoyée (les réponses du cache ne sont pas des essais)."""
+        with self._lock:
+            c = self.counts.setdefault(shape, {}).setdefault(variant, [0, 0])
+            c[0] += 1
+            c[1] += int(bool(success))
+            self.calls += 1
+            self._dirty += 1
+            autosave = self._dirty >= AUTOSAVE_EVERY
+        if autosave:
+            self.save()
+
+    def record_address(self):
+        with self._lock:
+            self.resolved += 1
+
+    def calls_per_address(self) -> float:
+        return self.calls / self.resolved if self.resolved else 0.0
+
+    def save(self):
+        if not self.path:
+            return
+        # instantané pris sous le verrou d'écriture : un état plus ancien n'écrase jamais un plus récent
+        with _SAVE_LOCK:
+            with self._lock:
+                data = json.dumps({"counts": self.counts, "resolved": self.resolved, "calls": self.calls},
+                                  ensure_ascii=False, indent=1)
+                self._dirty = 0
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                       prefix=f".{os.path.basename(self.path)}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp, self.path)
+            except Exception as e:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                print(f"⚠️ Statistiques de géocodage non sauvegardées ({self.path}) : {e}")
+
+
+@lru_cache(maxsize=None)
+def get_stats(path) -> LadderStats:
+    """Statistiques partagées par toutes les sessions du processus."""
+    return LadderStats(path)
+
+
+STREET_WORDS = re.compile(
+    r"\b(rue|r|avenue|av|boulevard|bd|chemin|ch|route|rte|place|pl|all[ée]e|impasse|imp|quai|cours|"
+    r"zone|za|zi|zac|parc|lieu[- ]dit|lotissement|hameau|domaine|r[ée]sidence|cit[ée]|faubourg|fg|"
+    r"square|voie|sentier|passage|esplanade|rond[- ]point|"
+    r"\w*stra(ss|ß)e|\w*straat|\w*weg|\w*laan|via|viale|piazza|calle|carretera|avenida|plaza)\b",
+    re.I,
+)
+
+
+def split_street(s: str, cp: str) -> str:
+    """
+    Partie "rue" d'une adresse : ce qui précède le code postal, s'il s'agit bien
+    d'une voie (numéro ou type de voie) ; "Hastingues 40300" n'a pas de rue.
+    """
+    if not cp or cp not in s:
+        return ""
+    street = re.sub(r"\s{2,}", " ", s.split(cp, 1)[0]).strip(" ,-")
+    return street if re.search(r"\d", street) or STREET_WORDS.search(street) else ""
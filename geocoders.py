@@ -0,0 +1,121 @@
+"""
+Interface commune des géocodeurs, et géocodage en masse via l'API Adresse (BAN).
+
+Un géocodeur renvoie, pour chaque requête, (lat, lon, pays, cp) ou None :
+
+    geocode(query)          une adresse
+    geocode_many(queries)   une liste d'adresses, dans le même ordre
+
+Nominatim (1 requête / s) ne sait faire que l'unitaire : geocode_many boucle.
+L'API Adresse accepte un CSV de milliers d'adresses par requête
+(POST /search/csv/) : un fichier de 1 000 fournisseurs français se géocode en
+quelques secondes au lieu d'une vingtaine de minutes. Les adresses non résolues
+(ou étrangères) repassent ensuite par la chaîne unitaire habituelle.
+"""
+import csv
+import io
+from abc import ABC, abstractmethod
+
+import requests
+from geopy.geocoders import Nominatim
+
+BAN_URL = "https://api-adresse.data.gouv.fr"
+BAN_MIN_SCORE = 0.6         # score BAN minimum (0..1) pour accepter un résultat
+BAN_CHUNK = 5000            # adresses par requête (limite de taille du service : 50 Mo)
+BAN_TIMEOUT = 120
+NOMINATIM_TIMEOUT = 20
+
+
+class Geocoder(ABC):
+    name = "geocoder"
+
+    @abstractmethod
+    def geocode(self, query):
+        ...
+
+    def geocode_many(self, queries):
+        return [self.geocode(q) for q in queries]
+
+
+class NominatimGeocoder(Geocoder):
+    """
+    Nominatim (texte libre ou requête structurée en dict street/postalcode/city/country).
+    throttle() est appelé avant chaque requête (limiteur de débit partagé) ;
+    place(lat, lon, adresse Nominatim, pays, cp) déduit pays et code postal.
+    """
+    name = "Nominatim"
+
+    def __init__(self, user_agent, domain="nominatim.openstreetmap.org", scheme="https",
+                 timeout=NOMINATIM_TIMEOUT, throttle=None, place=None):
+        self.client = Nominatim(user_agent=user_agent, domain=domain, scheme=scheme)
+        self.timeout = timeout
+        self.throttle = throttle
+        self.place = place
+
+    def geocode(self, query, country="", cp=""):
+        try:
+            if self.throttle is not None:
+                self.throttle()
+            loc = self.client.geocode(query, timeout=self.timeout, addressdetails=True)
+        except Exception as e:
+            print(f"❌ Erreur Géocodage ({query}): {e}")    # 403 / timeout visibles
+            return None
+        if not loc:
+            print(f"⚠️ Aucun résultat pour : {query}")
+            return None
+        addr = loc.raw.get("address") or {}
+        if self.place is not None:
+            country, cp = self.place(loc.latitude, loc.longitude, addr, country, cp)
+        else:
+            country, cp = addr.get("country") or country, addr.get("postcode") or cp
+        return (loc.latitude, loc.longitude, country, cp)
+
+
+class BanCsvGeocoder(Geocoder):
+    """Géocodage en masse par l'API Adresse (adresses françaises uniquement)."""
+    name = "BAN"
+
+    def __init__(self, url=BAN_URL, min_score=BAN_MIN_SCORE, chunk=BAN_CHUNK, timeout=BAN_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.min_score = min_score
+        self.chunk = chunk
+        self.timeout = timeout
+
+    def geocode(self, query):
+        return self.geocode_many([query])[0]
+
+    def geocode_many(self, queries):
+        queries = list(queries)
+        out = [None] * len(queries)
+        for start in range(0, len(queries), self.chunk):
+            part = queries[start:start + self.chunk]
+            try:
+                rows = self._post(part)
+            except Exception as e:
+                print(f"⚠️ API Adresse (CSV) échouée : {e}")
+                continue
+            for row in rows:
+                try:
+                    i = int(row["id"])
+                    score = float(row.get("result_score") or 0)
+                    if score < self.min_score or not row.get("latitude"):
+                        continue
+                    out[start + i] = (float(row["latitude"]), float(row["longitude"]),
+                                      "France", row.get("result_postcode") or "")
+                except (KeyError, ValueError, IndexError):
+                    continue
+        return out
+
+    def _post(self, queries):
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        w.writerow(["id", "adresse"])
+        w.writerows((i, q) for i, q in enumerate(queries))
+        r = requests.post(
+            f"{self.url}/search/csv/",
+            files={"data": ("adresses.csv", buf.getvalue().encode("utf-8"), "text/csv")},
+            data={"columns": "adresse"},
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        return list(csv.DictReader(io.StringIO(r.content.decode("utf-8-sig"))))
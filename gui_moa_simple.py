@@ -1,75 +1,214 @@
-
 import sys
 import os
+import queue
 import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox
 
 try:
-    from moa_core import process_csv_to_moa_df, export_moa_excel
+    from moa_core import process_csv_to_moa_df, export_moa_excel, export_moa_columnar
 except ImportError:
     try:
-        from moa_core_fallback import process_csv_to_moa_df, export_moa_excel  # type: ignore
+        from moa_core_fallback import process_csv_to_moa_df, export_moa_excel, export_moa_columnar  # type: ignore
     except ImportError as e:
         raise ImportError("Impossible d'importer moa_core ou moa_core_fallback. Place ce fichier dans le même dossier que moa_core.py.") from e
 
 APP_TITLE = "MOA Extractor"
+WATCH_INTERVAL_MS = 2000   # scrutation du dossier surveillé
+MAX_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+FORMATS = ("xlsx", "parquet", "feather")   # format de sortie ; sinon déduit de l'extension
 
-def convert(csv_path, save_path=None):
+def convert(csv_path, save_path=None, fmt=None):
     df = process_csv_to_moa_df(csv_path)
     if not save_path:
         root_noext, _ = os.path.splitext(csv_path)
-        save_path = root_noext + ".moa.xlsx"
-    export_moa_excel(df, save_path)
+        save_path = root_noext + ".moa." + (fmt or "xlsx")
+    fmt = fmt or os.path.splitext(save_path)[1].lstrip(".").lower()
+    if fmt in ("parquet", "feather"):
+        export_moa_columnar(df, save_path, fmt=fmt)
+    else:
+        export_moa_excel(df, save_path)
     return save_path
 
+def make_pool():
+    # processus de travail réutilisés : moa_core n'est importé qu'une fois par worker
+    return ProcessPoolExecutor(max_workers=MAX_WORKERS)
+
+def convert_many(csv_paths, pool=None, fmt=None):
+    """Convertit plusieurs CSV en parallèle. Renvoie [(csv, sortie ou None, erreur ou None)]."""
+    own = pool is None
+    pool = pool or make_pool()
+    try:
+        futures = [(p, pool.submit(convert, p, None, fmt)) for p in csv_paths]
+        results = []
+        for p, fut in futures:
+            try:
+                results.append((p, fut.result(), None))
+            except Exception as e:
+                results.append((p, None, e))
+        return results
+    finally:
+        if own:
+            pool.shutdown()
+
 def run_interactive():
     root = tk.Tk()
     root.title(APP_TITLE)
-    root.geometry("460x180")
+    root.geometry("640x420")
+
+    pool = make_pool()
+    events = queue.Queue()     # résultats des workers -> thread Tk
+    rows = {}                  # csv -> id de ligne dans la liste
+    watch = {"dir": None, "seen": {}, "pending": {}, "after": None}
 
     label_text = APP_TITLE + "\nCSV -> Excel (MOA)"
     label = tk.Label(root, text=label_text, font=("Segoe UI", 12))
     label.pack(pady=10)
 
+    def submit(csv_path, save_path=None):
+        name = os.path.basename(csv_path)
+        if csv_path in rows:
+            tree.item(rows[csv_path], values=(name, "En cours..."))
+        else:
+            rows[csv_path] = tree.insert("", "end", values=(name, "En cours..."))
+        fut = pool.submit(convert, csv_path, save_path)
+        fut.add_done_callback(lambda f: events.put((csv_path, f)))
+
+    def drain():
+        # le thread Tk est le seul à toucher aux widgets
+        while True:
+            try:
+                csv_path, fut = events.get_nowait()
+            except queue.Empty:
+                break
+            name = os.path.basename(csv_path)
+            try:
+                out = fut.result()
+                tree.item(rows[csv_path], values=(name, "✅ " + os.path.basename(out)))
+            except Exception as e:
+                tree.item(rows[csv_path], values=(name, "❌ {0}".format(e)))
+        root.after(100, drain)
+
     def on_click():
-        csv_path = filedialog.askopenfilename(
-            title="Choisir le CSV",
+        csv_paths = filedialog.askopenfilenames(
+            title="Choisir le(s) CSV",
             filetypes=[("CSV files", "*.csv")]
         )
-        if not csv_path:
+        if not csv_paths:
             return
         try:
-            save_path = filedialog.asksaveasfilename(
-                title="Enregistrer l'Excel",
-                defaultextension=".xlsx",
-                filetypes=[("Excel", "*.xlsx")]
-            )
-            if not save_path:
-                return
-            out = convert(csv_path, save_path)
-            messagebox.showinfo("Terminé", "Export réussi :\n" + out)
+            if len(csv_paths) == 1:
+                save_path = filedialog.asksaveasfilename(
+                    title="Enregistrer l'Excel",
+                    defaultextension=".xlsx",
+                    filetypes=[("Excel", "*.xlsx"), ("Parquet", "*.parquet"), ("Feather", "*.feather")]
+                )
+                if not save_path:
+                    return
+                submit(csv_paths[0], save_path)
+            else:
+                # plusieurs fichiers : chaque Excel est écrit à côté de son CSV
+                for p in csv_paths:
+                    submit(p)
         except Exception as e:
             messagebox.showerror("Erreur", "Une erreur est survenue :\n{0}\n\n{1}".format(e, traceback.format_exc()))
 
-    btn = tk.Button(root, text="Choisir un CSV et exporter l'Excel", command=on_click, width=42)
-    btn.pack(pady=10)
+    def poll_watch():
+        watch["after"] = None
+        d = watch["dir"]
+        if not d:
+            return
+        try:
+            for entry in os.scandir(d):
+                if not entry.is_file() or not entry.name.lower().endswith(".csv"):
+                    continue
+                st = entry.stat()
+                sig = (st.st_mtime, st.st_size)
+                if watch["seen"].get(entry.path) == sig:
+                    continue
+                # on attend que la taille soit stable d'une scrutation à l'autre (export en cours d'écriture)
+                if watch["pending"].get(entry.path) == sig:
+                    del watch["pending"][entry.path]
+                    watch["seen"][entry.path] = sig
+                    submit(entry.path)
+                else:
+                    watch["pending"][entry.path] = sig
+        except OSError as e:
+            watch_label.config(text="Dossier surveillé inaccessible : {0}".format(e))
+        watch["after"] = root.after(WATCH_INTERVAL_MS, poll_watch)
+
+    def on_watch():
+        if watch["dir"]:
+            watch["dir"] = None
+            # annule la scrutation programmée : un redémarrage rapide n'en lance pas une seconde
+            if watch["after"] is not None:
+                root.after_cancel(watch["after"])
+                watch["after"] = None
+            watch_btn.config(text="Surveiller un dossier")
+            watch_label.config(text="")
+            return
+        d = filedialog.askdirectory(title="Dossier des exports CSV à surveiller")
+        if not d:
+            return
+        watch.update({"dir": d, "seen": {}, "pending": {}})
+        # les CSV déjà convertis (Excel plus récent) ne sont pas refaits
+        for entry in os.scandir(d):
+            if entry.is_file() and entry.name.lower().endswith(".csv"):
+                out = os.path.splitext(entry.path)[0] + ".moa.xlsx"
+                if os.path.exists(out) and os.path.getmtime(out) >= entry.stat().st_mtime:
+                    st = entry.stat()
+                    watch["seen"][entry.path] = (st.st_mtime, st.st_size)
+        watch_btn.config(text="Arrêter la surveillance")
+        watch_label.config(text="Surveillance : " + d)
+        poll_watch()
+
+    btns = tk.Frame(root)
+    btns.pack(pady=5)
+    btn = tk.Button(btns, text="Choisir des CSV et exporter l'Excel", command=on_click, width=34)
+    btn.pack(side="left", padx=5)
+    watch_btn = tk.Button(btns, text="Surveiller un dossier", command=on_watch, width=24)
+    watch_btn.pack(side="left", padx=5)
+    watch_label = tk.Label(root, text="", font=("Segoe UI", 9), fg="#555")
+    watch_label.pack()
 
+    tree = ttk.Treeview(root, columns=("fichier", "statut"), show="headings", height=12)
+    tree.heading("fichier", text="Fichier")
+    tree.heading("statut", text="Statut")
+    tree.column("fichier", width=260)
+    tree.column("statut", width=340)
+    tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+    def on_close():
+        pool.shutdown(wait=False, cancel_futures=True)
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    root.after(100, drain)
     root.mainloop()
 
 if __name__ == "__main__":
-    # If a CSV path is provided as argument -> auto convert without full GUI
-    # Enables drag-and-drop of a CSV onto the EXE in Windows
-    if len(sys.argv) > 1:
-        csv_path = sys.argv[1]
-        try:
-            out = convert(csv_path)
-            print(out)
-        except Exception as e:
+    multiprocessing.freeze_support()   # requis pour le pool de processus dans l'EXE
+    # If CSV paths are provided as arguments -> auto convert without full GUI
+    # Enables drag-and-drop of one or many CSVs onto the EXE in Windows
+    # --parquet / --feather : sortie en format colonne au lieu de l'Excel
+    args = sys.argv[1:]
+    fmt = next((a[2:] for a in args if a[2:] in FORMATS and a.startswith("--")), None)
+    args = [a for a in args if not a.startswith("--")]
+    if args:
+        results = convert_many(args, fmt=fmt)
+        errors = []
+        for csv_path, out, err in results:
+            if err is None:
+                print(out)
+            else:
+                errors.append("{0} : {1}".format(os.path.basename(csv_path), err))
+        if errors:
             # use a tiny Tk root to show a dialog
             root = tk.Tk()
             root.withdraw()
-            messagebox.showerror("Erreur", "Echec conversion :\n{0}\n\n{1}".format(e, traceback.format_exc()))
+            messagebox.showerror("Erreur", "Echec conversion :\n" + "\n".join(errors))
             root.destroy()
     else:
         run_interactive()
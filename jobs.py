@@ -0,0 +1,261 @@
+"""
+Tâches d'arrière-plan pour le mode enrichi.
+
+Un run enrichi peut durer des dizaines de minutes : exécuté dans le thread du
+script Streamlit, il est perdu au moindre rafraîchissement du navigateur,
+expiration de session ou redéploiement. Ici, chaque run est une tâche
+identifiée, exécutée par un pool de workers du processus serveur :
+
+    jobs/<id>/input.csv          CSV déposé
+    jobs/<id>/meta.json          statut, avancement, adresse du projet, messages du calcul
+    jobs/<id>/checkpoint.jsonl   une ligne par fournisseur déjà calculé (+ heure de lancement)
+    jobs/<id>/result.parquet     résultat final (+ coords.json)
+    jobs/<id>/profile.folded     piles échantillonnées si l'option "profile" est active
+
+L'identifiant dérive du contenu (CSV + adresse + options de calcul, hors profilage) :
+resoumettre le même fichier rattache à la tâche existante (et relance les lignes
+d'une tâche terminée hors délai). Au démarrage, les tâches interrompues reprennent
+depuis leur dernier checkpoint.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+
+import pandas as pd
+
+JOBS_DIR = "jobs"
+WORKERS = 2
+PENDING = ("queued", "running")
+RUN_ONLY_OPTIONS = ("profile",)     # options sans effet sur le résultat : hors de l'identifiant
+
+
+def job_id_for(csv_bytes: bytes, base_address: str, options=None) -> str:
+    h = hashlib.sha1(csv_bytes)
+    h.update(b"\x1f" + base_address.strip().lower().encode("utf-8"))
+    options = {k: v for k, v in (options or {}).items() if k not in RUN_ONLY_OPTIONS}
+    if options:
+        h.update(b"\x1f" + json.dumps(options, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:12]
+
+
+def _write_json(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class Checkpoint:
+    """
+    Journal des lignes déjà calculées (JSON lines, ajout seul). Une ligne
+    {"started": ...} date le lancement de la tâche : le délai de calcul court
+    depuis ce moment, reprises comprises (la dernière ligne de ce type l'emporte).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = {}
+        self.started = None
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue        # dernière ligne tronquée par l'interruption
+                    if "started" in rec:
+                        self.started = rec["started"]
+                    elif "i" in rec:
+                        self.done[rec["i"]] = rec
+        self._fh = open(path, "a", encoding="utf-8")
+        if self.started is None:
+            self.restart_clock()
+
+    def restart_clock(self):
+        """Nouveau départ pour le délai (relance d'une tâche terminée en mode dégradé)."""
+        with self._lock:
+            self.started = time.time()
+            self._fh.write(json.dumps({"started": self.started}) + "\n")
+            self._fh.flush()
+
+    def get(self, pos):
+        """(adresse, (lat,lon) or None, pays, cp, dist, type) si la ligne est déjà faite."""
+        rec = self.done.get(pos)
+        if rec is None:
+            return None
+        coords = (rec["lat"], rec["lon"]) if rec["lat"] is not None else None
+        return rec["addr"], coords, rec["country"], rec["cp"], rec["dist"], rec["type"]
+
+    def add(self, pos, kept_addr, coords, country, cp, dist, dist_type):
+        rec = {
+            "i": pos, "addr": str(kept_addr or ""),
+            "lat": coords[0] if coords else None, "lon": coords[1] if coords else None,
+            "country": str(country or ""), "cp": str(cp or ""),
+            "dist": None if dist in (None, "") else float(dist), "type": str(dist_type or ""),
+        }
+        with self._lock:
+            self.done[pos] = rec
+            self._fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+
+class JobManager:
+    def __init__(self, root=JOBS_DIR, workers=WORKERS):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._active = set()
+        self.resume_pending()
+
+    # ------------------------------------------------------------------ chemins
+    def _dir(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def input_path(self, job_id):
+        return os.path.join(self._dir(job_id), "input.csv")
+
+    # ------------------------------------------------------------------ statut
+    def status(self, job_id):
+        path = os.path.join(self._dir(job_id), "meta.json")
+        if not job_id or not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _update(self, job_id, **fields):
+        meta = self.status(job_id) or {}
+        meta.update(fields, updated=time.time())
+        _write_json(os.path.join(self._dir(job_id), "meta.json"), meta)
+        return meta
+
+    def list(self):
+        metas = [self.status(j) for j in os.listdir(self.root)]
+        return sorted((m for m in metas if m), key=lambda m: m.get("created", 0), reverse=True)
+
+    # ------------------------------------------------------------------ soumission
+    def submit(self, csv_bytes: bytes, base_address: str, options=None) -> str:
+        """
+        Crée (ou retrouve) la tâche pour ce CSV et cette adresse, et la met en file.
+        options : paramètres supplémentaires de compute_distances (ex. cutoff_km).
+        """
+        options = {k: v for k, v in (options or {}).items() if v is not None}
+        job_id = job_id_for(csv_bytes, base_address, options)
+        meta = self.status(job_id)
+        if meta and meta["status"] == "done" and meta.get("degraded"):
+            # délai atteint au run précédent : les lignes approchées (absentes du checkpoint)
+            # sont recalculées, avec un délai neuf ; les autres sont reprises telles quelles
+            checkpoint = Checkpoint(os.path.join(self._dir(job_id), "checkpoint.jsonl"))
+            checkpoint.restart_clock()
+            checkpoint.close()
+            meta = self._update(job_id, status="queued", degraded=0, messages=[])
+        if meta and meta["status"] != "error":
+            self._enqueue(job_id)        # déjà faite, ou en cours / à reprendre
+            return job_id
+        os.makedirs(self._dir(job_id), exist_ok=True)
+        with open(self.input_path(job_id), "wb") as f:
+            f.write(csv_bytes)
+        _write_json(os.path.join(self._dir(job_id), "meta.json"), {
+            "id": job_id, "status": "queued", "base_address": base_address, "options": options,
+            "created": time.time(), "updated": time.time(), "done_rows": 0, "n_rows": None, "error": "",
+        })
+        self._enqueue(job_id)
+        return job_id
+
+    def resume_pending(self):
+        for meta in self.list():
+            if meta["status"] in PENDING:
+                self._enqueue(meta["id"])
+
+    def _enqueue(self, job_id):
+        meta = self.status(job_id)
+        if not meta or meta["status"] not in PENDING:
+            return
+        with self._lock:
+            if job_id in self._active:
+                return
+            self._active.add(job_id)
+        self._pool.submit(self._run, job_id)
+
+    # ------------------------------------------------------------------ exécution
+    def _run(self, job_id):
+        from sourcing_core import process_csv_to_df, compute_distances, collect_notices, DEGRADED_PRECISIONS
+
+        checkpoint = None
+        notices = []
+        try:
+            meta = self._update(job_id, status="running", started=time.time())   # attente en file : started - created
+            options = dict(meta.get("options") or {})
+            profiler = None
+            if options.pop("profile", False):
+                from profiling import SamplingProfiler
+                profiler = SamplingProfiler()
+
+            with profiler or nullcontext():
+                base_df = process_csv_to_df(self.input_path(job_id))
+                checkpoint = Checkpoint(os.path.join(self._dir(job_id), "checkpoint.jsonl"))
+                self._update(job_id, n_rows=len(base_df), done_rows=len(checkpoint.done))
+
+                last = [0.0]
+                def progress(done, total):
+                    if time.monotonic() - last[0] > 2 or done == total:
+                        last[0] = time.monotonic()
+                        self._update(job_id, done_rows=done, n_rows=total)
+
+                # pas de page Streamlit dans ce thread : les messages sont gardés pour l'app
+                with collect_notices() as notices:
+                    df, base_coords, coords_dict = compute_distances(
+                        base_df, meta["base_address"], checkpoint=checkpoint, progress=progress, **options
+                    )
+            if profiler is not None:
+                with open(os.path.join(self._dir(job_id), "profile.folded"), "w", encoding="utf-8") as f:
+                    f.write(profiler.folded())
+            df.to_parquet(os.path.join(self._dir(job_id), "result.parquet"), index=False)
+            _write_json(os.path.join(self._dir(job_id), "coords.json"), {
+                "base": list(base_coords) if base_coords else None,
+                "coords": {k: list(v) for k, v in coords_dict.items()},
+            })
+            # lignes approchées faute de temps : une nouvelle soumission les recalcule
+            degraded = int(df["Fiabilité géocode"].isin(DEGRADED_PRECISIONS).sum())
+            self._update(job_id, status="done", done_rows=len(df), messages=notices, degraded=degraded)
+        except Exception as e:
+            print(f"❌ Tâche {job_id} en échec : {e}\n{traceback.format_exc()}")
+            self._update(job_id, status="error", error=str(e), messages=notices)
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+            with self._lock:
+                self._active.discard(job_id)
+
+    def load_result(self, job_id):
+        """(df, base_coords, coords_dict) d'une tâche terminée."""
+        d = self._dir(job_id)
+        df = pd.read_parquet(os.path.join(d, "result.parquet"))
+        with open(os.path.join(d, "coords.json"), encoding="utf-8") as f:
+            c = json.load(f)
+        base = tuple(c["base"]) if c["base"] else None
+        return df, base, {k: tuple(v) for k, v in c["coords"].items()}
+
+    def load_profile(self, job_id) -> str:
+        """Piles repliées du calcul d'une tâche profilée ("" sinon)."""
+        path = os.path.join(self._dir(job_id), "profile.folded")
+        if not os.path.exists(path):
+            return ""
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+
+@lru_cache(maxsize=None)
+def get_manager(root=JOBS_DIR) -> JobManager:
+    """Gestionnaire unique par processus serveur (partagé par toutes les sessions)."""
+    return JobManager(root)
@@ -0,0 +1,472 @@
+"""
+Test de charge de l'application Streamlit, de bout en bout et sans navigateur.
+
+Pour chaque niveau de concurrence N, un vrai serveur `streamlit run` (headless)
+est démarré, puis N clients s'y connectent en même temps par le protocole du
+navigateur (websocket /_stcore/stream, envoi du fichier par /_stcore/upload_file) :
+chaque client dépose un CSV synthétique différent, en mode simple ou enrichi,
+et attend les boutons de téléchargement. Toutes les sessions partagent donc le
+même processus : file de tâches (JobManager), SingleFlight, limiteurs de débit
+(FairRateLimiter, laissés actifs) et caches.
+
+Nominatim, OSRM et l'API Adresse (CSV) sont remplacés par des bouchons HTTP
+locaux (latence configurable) ; --interval règle les limiteurs de l'application
+(par défaut ceux de production : 1,1 s Nominatim, 1 s OSRM).
+
+    python loadtest.py --levels 1 2 4 8 --rows 60 --modes simple enrichi --interval 0.05
+
+Rapport : latences p50 / p90 / p99 par session, attente en file des tâches
+enrichies (p50 / max), débit (sessions/min et lignes/s), RSS du serveur
+(au repos, pic pendant le niveau, en fin de niveau), nombre d'erreurs.
+"""
+import argparse
+import csv
+import email.parser
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(HERE, "app_moa_distance_map_full.py")
+ASSETS = ["Sourcing base.xlsx", "doc_base_contact_simple.xlsx", "Conseil-noir.jpg", "data"]
+MODE_LABELS = {
+    "simple": "🧾 Mode simple (Nettoyage uniquement)",
+    "enrichi": "🚗 Mode enrichi (Carte + Distances)",
+}
+MODE_LABEL = "Type de traitement souhaité :"
+ADDRESS_LABEL = "Adresse"
+EXPECTED_DOWNLOAD = {"simple": "📄 EXCEL SIMPLE", "enrichi": "📊 EXCEL COMPLET"}
+BASE_ADDRESS = "69003 Lyon"
+SESSION_TIMEOUT = 900
+SERVER_START_TIMEOUT = 60
+RSS_SAMPLE_S = 0.2
+
+
+# ============================ BOUCHONS HTTP ============================
+def _fake_point(text):
+    """Coordonnées déterministes en France métropolitaine pour un texte donné."""
+    h = hashlib.sha1(text.lower().encode("utf-8")).digest()
+    lat = 43.0 + h[0] / 255 * 7.0
+    lon = -1.0 + h[1] / 255 * 8.0
+    return lat, lon
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Nominatim (/search), OSRM (/route/v1/driving/...) et API Adresse (POST /search/csv/) minimalistes."""
+    latency = 0.0
+    hits = None
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlsplit(self.path)   # urlsplit : le ";" des coordonnées OSRM reste dans le chemin
+        qs = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path.startswith("/search"):
+            self.hits["nominatim"] += 1
+            text = qs.get("q") or " ".join(qs.get(k, "") for k in ("street", "postalcode", "city", "country"))
+            cp = re.search(r"\b\d{5}\b", text)
+            lat, lon = _fake_point(text)
+            self._json([{
+                "lat": str(lat), "lon": str(lon), "display_name": text,
+                "address": {"country": "France", "postcode": cp.group(0) if cp else "75000"},
+            }])
+        elif url.path.startswith("/route/"):
+            self.hits["osrm"] += 1
+            pts = url.path.rsplit("/", 1)[-1].split(";")
+            (lon1, lat1), (lon2, lat2) = [tuple(map(float, p.split(","))) for p in pts]
+            geo = ((lat1 - lat2) ** 2 + ((lon1 - lon2) * 0.7) ** 2) ** 0.5 * 111.0
+            self._json({"code": "Ok", "routes": [{"distance": geo * 1.3 * 1000.0}]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        if not self.path.startswith("/search/csv"):
+            self.send_error(404)
+            return
+        self.hits["ban"] += 1
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        msg = email.parser.BytesParser().parsebytes(
+            b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+        data = next(p.get_payload(decode=True) for p in msg.get_payload() if p.get_param("name", header="content-disposition") == "data")
+        out = io.StringIO()
+        w = csv.writer(out)
+        w.writerow(["id", "adresse", "latitude", "longitude", "result_score", "result_postcode"])
+        for row in csv.DictReader(io.StringIO(data.decode("utf-8"))):
+            cp = re.search(r"\b\d{5}\b", row["adresse"])
+            lat, lon = _fake_point(row["adresse"])
+            w.writerow([row["id"], row["adresse"], lat, lon, 0.9 if cp else 0.3, cp.group(0) if cp else ""])
+        payload = out.getvalue().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_stand_ins(latency):
+    handler = type("Handler", (StandInHandler,), {"latency": latency, "hits": {"nominatim": 0, "osrm": 0, "ban": 0}})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler.hits
+
+
+
+
+# ============================ SERVEUR ============================
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_mb(pid, field="VmRSS"):
+    """Mémoire résidente (Mo) d'un processus, lue dans /proc (Linux) ; NaN ailleurs."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+class AppServer:
+    """Un processus `streamlit run` headless servant l'application depuis un dossier de travail neuf."""
+
+    def __init__(self, env):
+        self.workdir = _workdir()
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._log = open(os.path.join(self.workdir, "server.log"), "w", encoding="utf-8")
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", APP,
+             "--server.headless", "true", "--server.port", str(self.port), "--server.address", "127.0.0.1",
+             "--server.enableXsrfProtection", "false", "--server.fileWatcherType", "none",
+             "--browser.gatherUsageStats", "false"],
+            cwd=self.workdir, env=env, stdout=self._log, stderr=subprocess.STDOUT,
+        )
+        self.peak_rss = 0.0
+        self._stop = threading.Event()
+        self._wait_ready()
+        self.idle_rss = self.rss()
+        threading.Thread(target=self._sample, daemon=True).start()
+
+    def _wait_ready(self):
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < SERVER_START_TIMEOUT:
+            if self.proc.poll() is not None:
+                break
+            try:
+                if requests.get(f"{self.url}/_stcore/health", timeout=1).ok:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"serveur Streamlit non démarré :\n{self.log_tail()}")
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_S):
+            self.peak_rss = max(self.peak_rss, self.rss())
+
+    def rss(self):
+        return _rss_mb(self.proc.pid)
+
+    def meta(self, job_id):
+        try:
+            with open(os.path.join(self.workdir, "jobs", job_id, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def log_tail(self, n=1500):
+        self._log.flush()
+        with open(self._log.name, encoding="utf-8", errors="replace") as f:
+            return f.read()[-n:]
+
+    def stop(self):
+        self._stop.set()
+        self.proc.terminate()
+        try:
+            self.proc.wait(10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self._log.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# ============================ CLIENTS ============================
+class BrowserSession:
+    """
+    Client minimal du protocole Streamlit : ce que fait l'onglet du navigateur
+    (exécutions du script, valeurs des widgets, envoi de fichier, relances des fragments).
+    """
+
+    def __init__(self, server):
+        from websockets.sync.client import connect
+
+        self.server = server
+        self.ws = connect(f"ws://127.0.0.1:{server.port}/_stcore/stream", subprotocols=["streamlit"],
+                          origin=server.url, max_size=None, open_timeout=30)
+        self.session_id = None
+        self.widgets = {}           # libellé -> id du widget (relu à chaque exécution)
+        self.labels = set()         # libellés des boutons de téléchargement affichés
+        self.errors = []
+        self.query_string = ""
+        self.auto_rerun = None      # (intervalle s, id du fragment) demandé par st.fragment(run_every=...)
+        self.states = {}            # id -> WidgetState envoyé à chaque exécution
+
+    def __enter__(self):
+        self.ws.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.ws.__exit__(*exc)
+
+    def _send(self, back):
+        self.ws.send(back.SerializeToString())
+
+    def _recv(self, deadline):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = ForwardMsg()
+        msg.ParseFromString(self.ws.recv(timeout=max(0.1, deadline - time.monotonic())))
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            self.session_id = msg.new_session.initialize.session_id
+        elif kind == "page_info_changed":
+            self.query_string = msg.page_info_changed.query_string
+        elif kind == "auto_rerun":
+            self.auto_rerun = (msg.auto_rerun.interval, msg.auto_rerun.fragment_id)
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            el = msg.delta.new_element
+            t = el.WhichOneof("type")
+            w = getattr(el, t)
+            if t == "download_button":
+                self.labels.add(w.label)
+            elif t == "exception":
+                self.errors.append(f"{w.type}: {w.message}")
+            elif t == "alert" and w.format == type(w).ERROR:
+                self.errors.append(w.body)
+            elif getattr(w, "id", "") and getattr(w, "label", ""):
+                self.widgets[w.label] = w.id
+        return msg, kind
+
+    def run(self, fragment_id="", timeout=SESSION_TIMEOUT):
+        """Exécute le script (ou un fragment) avec les valeurs courantes et attend sa fin."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        back = BackMsg()
+        cs = back.rerun_script
+        cs.query_string = self.query_string
+        cs.widget_states.widgets.extend(self.states.values())
+        if fragment_id:
+            cs.fragment_id = fragment_id
+            cs.is_auto_rerun = True
+        self._send(back)
+        deadline = time.monotonic() + timeout
+        done = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+                ForwardMsg.FINISHED_WITH_COMPILE_ERROR)
+        while True:
+            msg, kind = self._recv(deadline)
+            if kind == "script_finished" and msg.script_finished in done:
+                return
+
+    def set_value(self, label, **value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        wid = self.widgets[label]
+        state = WidgetState(id=wid, **value)
+        self.states[wid] = state
+
+    def upload(self, label, name, payload, timeout=60):
+        """Envoi d'un fichier comme le navigateur : URL d'envoi demandée au serveur, PUT, puis valeur du widget."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.Common_pb2 import FileUploaderState, UploadedFileInfo
+
+        back = BackMsg()
+        back.file_urls_request.request_id = uuid.uuid4().hex
+        back.file_urls_request.session_id = self.session_id
+        back.file_urls_request.file_names.append(name)
+        self._send(back)
+        deadline = time.monotonic() + timeout
+        while True:
+            msg, kind = self._recv(deadline)
+            if kind == "file_urls_response" and msg.file_urls_response.response_id == back.file_urls_request.request_id:
+                urls = msg.file_urls_response.file_urls[0]
+                break
+        r = requests.put(self.server.url + urls.upload_url, files={"file": (name, payload, "text/csv")}, timeout=timeout)
+        r.raise_for_status()
+        info = UploadedFileInfo(name=name, size=len(payload), file_id=urls.file_id, file_urls=urls)
+        self.set_value(label, file_uploader_state_value=FileUploaderState(uploaded_file_info=[info]))
+
+
+def run_session(server, csv_bytes, mode, timeout=SESSION_TIMEOUT):
+    """
+    Une session utilisateur complète. Renvoie (latence s jusqu'aux téléchargements,
+    attente en file de la tâche en s ou None).
+    """
+    with BrowserSession(server) as s:
+        s.run()
+        t0 = time.perf_counter()
+        if mode == "enrichi":
+            s.set_value(MODE_LABEL, string_value=MODE_LABELS[mode])
+            s.run()
+            s.set_value(ADDRESS_LABEL, string_value=BASE_ADDRESS)
+        s.upload(next(l for l in s.widgets if l.startswith("Choisissez")), "export.csv", csv_bytes)
+        s.run()
+        # mode enrichi : le fragment d'avancement est relancé comme par le navigateur,
+        # jusqu'à la fin de la tâche (le fragment relance alors toute la page)
+        while EXPECTED_DOWNLOAD[mode] not in s.labels and not s.errors:
+            if s.auto_rerun is None or time.perf_counter() - t0 > timeout:
+                raise TimeoutError(f"pas de bouton {EXPECTED_DOWNLOAD[mode]}")
+            interval, fragment_id = s.auto_rerun
+            time.sleep(interval)
+            s.run(fragment_id)
+        if s.errors:
+            raise RuntimeError(s.errors[0])
+        latency = time.perf_counter() - t0
+    wait = None
+    job = parse_qs(s.query_string).get("job")
+    if job:
+        meta = server.meta(job[0])
+        if meta.get("started") and meta.get("created"):
+            wait = meta["started"] - meta["created"]
+    return latency, wait
+
+
+def run_level(level, mode, rows, env):
+    """`level` sessions simultanées contre un même serveur ; renvoie (rapports, RSS repos/pic/fin en Mo)."""
+    from bench_memory import make_csv
+
+    payloads = []
+    with tempfile.TemporaryDirectory() as d:
+        for i in range(level):
+            path = os.path.join(d, f"in_{i}.csv")
+            make_csv(path, rows, seed=1000 * level + i)
+            with open(path, "rb") as f:
+                payloads.append(f.read())
+
+    server = AppServer(env)
+    reports = [None] * level
+    start = threading.Barrier(level)
+
+    def one(i):
+        start.wait()
+        t0 = time.time()
+        latency, wait, error = None, None, None
+        try:
+            latency, wait = run_session(server, payloads[i], mode)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        reports[i] = {"latency": latency, "queue_wait": wait, "error": error, "start": t0, "end": time.time()}
+
+    try:
+        threads = [threading.Thread(target=one, args=(i,)) for i in range(level)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        rss = (server.idle_rss, max(server.peak_rss, server.rss()), server.rss())
+        if any(r["error"] for r in reports):
+            print(server.log_tail())
+    finally:
+        server.stop()
+    return reports, rss
+
+
+# ============================ RAPPORT ============================
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    s = sorted(values)
+    k = (len(s) - 1) * q / 100
+    lo, hi = int(k), min(int(k) + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def _workdir():
+    d = tempfile.mkdtemp(prefix="moa_load_")
+    for name in ASSETS:
+        src = os.path.join(HERE, name)
+        if os.path.exists(src):
+            os.symlink(src, os.path.join(d, name))
+    return d
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8], help="nombres de sessions simultanées")
+    ap.add_argument("--modes", nargs="+", choices=sorted(MODE_LABELS), default=["simple", "enrichi"])
+    ap.add_argument("--rows", type=int, default=60, help="lignes par CSV synthétique")
+    ap.add_argument("--latency", type=float, default=0.02, help="latence des bouchons HTTP (s)")
+    ap.add_argument("--interval", type=float, default=None,
+                    help="intervalle des limiteurs Nominatim/OSRM de l'application (défaut : ceux de production)")
+    ap.add_argument("--no-bulk", action="store_true", help="sans géocodage en masse (Nominatim seul)")
+    args = ap.parse_args(argv)
+
+    sys.path.insert(0, HERE)
+    stand_ins, hits = start_stand_ins(args.latency)
+    host, port = stand_ins.server_address
+    env = dict(os.environ,
+               MOA_NOMINATIM_DOMAIN=f"{host}:{port}", MOA_NOMINATIM_SCHEME="http",
+               MOA_OSRM_URL=f"http://{host}:{port}", MOA_BAN_URL="" if args.no_bulk else f"http://{host}:{port}")
+    if args.interval is not None:
+        env.update(MOA_NOMINATIM_INTERVAL=str(args.interval), MOA_OSRM_INTERVAL=str(args.interval))
+
+    cols = ["mode", "sessions", "p50 s", "p90 s", "p99 s", "file p50", "file max", "sess/min", "lignes/s",
+            "RSS repos", "RSS pic", "RSS fin", "geo req", "ban req", "osrm req", "erreurs"]
+    print(" ".join(f"{c:>9}" for c in cols))
+    try:
+        for mode in args.modes:
+            for level in args.levels:
+                before = dict(hits)
+                reports, (idle, peak, end) = run_level(level, mode, args.rows, env)
+                lat = [r["latency"] for r in reports if r["latency"] is not None]
+                waits = [r["queue_wait"] for r in reports if r["queue_wait"] is not None]
+                errors = [r["error"] for r in reports if r["error"]]
+                wall = max(r["end"] for r in reports) - min(r["start"] for r in reports)
+                row = [
+                    mode, level,
+                    f"{percentile(lat, 50):.2f}", f"{percentile(lat, 90):.2f}", f"{percentile(lat, 99):.2f}",
+                    f"{percentile(waits, 50):.2f}", f"{max(waits) if waits else float('nan'):.2f}",
+                    f"{60 * len(lat) / wall:.1f}", f"{len(lat) * args.rows / wall:.0f}",
+                    f"{idle:.0f}", f"{peak:.0f}", f"{end:.0f}",
+                    hits["nominatim"] - before["nominatim"], hits["ban"] - before["ban"], hits["osrm"] - before["osrm"],
+                    len(errors),
+                ]
+                print(" ".join(f"{str(c):>9}" for c in row), flush=True)
+                for err in errors[:3]:
+                    print(f"{'':>9} ⚠️ {err}")
+    finally:
+        stand_ins.shutdown()
+
+
+if __name__ == "__main__":
+    main()
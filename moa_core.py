@@ -1,6 +1,7 @@
 
 import re
 import pandas as pd
+from category_index import CategoryIndex, write_category_sheets
 
 def _find_columns(cols):
     res = {}
@@ -66,10 +67,27 @@ def process_csv_to_moa_df(csv_bytes_or_path):
     out["Catégories"] = df[colmap["categorie"]].apply(lambda x: str(x).strip() if pd.notna(x) else "")
     return out
 
-def export_moa_excel(df, out_path_or_buffer):
+def _autofit(ws, df):
+    for idx, col in enumerate(df.columns):
+        max_len = max([len(str(x)) for x in df[col].astype(str).values] + [len(col)])
+        ws.set_column(idx, idx, min(60, max(12, max_len + 2)))
+
+def export_moa_excel(df, out_path_or_buffer, by_category=False, category_index=None):
+    """Feuille "MOA" complète ; avec by_category=True, une feuille de plus par catégorie."""
     with pd.ExcelWriter(out_path_or_buffer, engine="xlsxwriter") as writer:
         df.to_excel(writer, index=False, sheet_name="MOA")
-        ws = writer.sheets["MOA"]
-        for idx, col in enumerate(df.columns):
-            max_len = max([len(str(x)) for x in df[col].astype(str).values] + [len(col)])
-            ws.set_column(idx, idx, min(60, max(12, max_len + 2)))
+        _autofit(writer.sheets["MOA"], df)
+        if by_category:
+            index = category_index if category_index is not None else CategoryIndex.from_series(df["Catégories"])
+            write_category_sheets(writer, df, index, autofit=_autofit, reserved=["MOA"])
+
+def export_moa_columnar(df, out_path_or_buffer, fmt="parquet"):
+    """Même contenu que l'Excel MOA, en Parquet ou Feather typé (texte Arrow, Catégories catégoriel)."""
+    out = df.copy()
+    for col in out.columns:
+        out[col] = out[col].astype(pd.StringDtype("pyarrow")).fillna("")
+    out["Catégories"] = out["Catégories"].astype("category")
+    if fmt == "feather":
+        out.reset_index(drop=True).to_feather(out_path_or_buffer)
+    else:
+        out.to_parquet(out_path_or_buffer, index=False)
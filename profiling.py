@@ -0,0 +1,183 @@
+"""
+Profilage à la demande d'un run (lecture CSV, distances, exports, carte).
+
+Activation sans changer de code : `?profile=1` dans l'URL de l'app, ou variable
+d'environnement MOA_PROFILE=1. Un thread échantillonne la pile des threads
+profilés toutes les `interval` secondes (sys._current_frames) : le coût reste
+faible même sur un fichier pathologique, contrairement à un traceur qui
+instrumente chaque appel.
+
+Sorties :
+    folded()  piles repliées « a;b;c N » (flamegraph.pl, speedscope, inferno)
+    svg()     flame graph autonome, ouvrable dans un navigateur
+"""
+import html
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+
+ENV_FLAG = "MOA_PROFILE"
+QUERY_PARAM = "profile"
+INTERVAL = 0.005        # 200 échantillons / s
+MAX_DEPTH = 200
+
+
+def profiling_enabled(query_params=None) -> bool:
+    if os.environ.get(ENV_FLAG, "").strip() in ("1", "true", "yes"):
+        return True
+    return bool(query_params) and str(query_params.get(QUERY_PARAM, "")).strip() in ("1", "true", "yes")
+
+
+def _label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Profileur par échantillonnage, utilisable comme gestionnaire de contexte
+    (éventuellement plusieurs fois, depuis plusieurs threads : les piles s'additionnent).
+
+        prof = SamplingProfiler()
+        with prof:
+            process_csv_to_df(...)
+    """
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()         # tuple de frames (racine -> feuille) -> nb d'échantillons
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+        self._threads = Counter()       # thread id -> nb d'activations en cours
+        self._sampler = None
+        self._t0 = {}
+        self._roots = {}                # thread id -> frame qui a activé le profileur (pile coupée au-dessus)
+
+    # ------------------------------------------------------------------ activation
+    def __enter__(self):
+        tid = threading.get_ident()
+        with self._lock:
+            self._threads[tid] += 1
+            self._t0.setdefault(tid, time.perf_counter())
+            self._roots.setdefault(tid, sys._getframe(1))
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        tid = threading.get_ident()
+        with self._lock:
+            self._threads[tid] -= 1
+            if self._threads[tid] <= 0:
+                del self._threads[tid]
+                self.elapsed += time.perf_counter() - self._t0.pop(tid)
+                del self._roots[tid]
+            sampler = self._sampler if not self._threads else None
+            if sampler is not None:
+                self._sampler = None
+        if sampler is not None:
+            sampler.join()
+        return False
+
+    def _run(self):
+        me = threading.current_thread()
+        while True:
+            with self._lock:
+                if self._sampler is not me:
+                    return
+                targets = list(self._roots.items())
+            frames = sys._current_frames()
+            for tid, root in targets:
+                frame = frames.get(tid)
+                stack = []
+                while frame is not None and frame is not root and len(stack) < MAX_DEPTH:
+                    stack.append(_label(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    key = tuple(reversed(stack))
+                    with self._lock:
+                        self.stacks[key] += 1
+            del frames, targets
+            time.sleep(self.interval)
+
+    # ------------------------------------------------------------------ résultats
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def folded(self) -> str:
+        with self._lock:
+            items = sorted(self.stacks.items())
+        return "".join(f"{';'.join(s)} {n}\n" for s, n in items)
+
+    def merge_folded(self, text: str):
+        """Ajoute des piles repliées (ex. profil d'une tâche d'arrière-plan)."""
+        with self._lock:
+            for line in (text or "").splitlines():
+                stack, _, n = line.rpartition(" ")
+                if stack and n.isdigit():
+                    self.stacks[tuple(stack.split(";"))] += int(n)
+
+    def top(self, n=15):
+        """[(fonction, échantillons inclusifs)] triés, pour un résumé texte."""
+        incl = Counter()
+        with self._lock:
+            for stack, c in self.stacks.items():
+                for name in set(stack):
+                    incl[name] += c
+        return incl.most_common(n)
+
+    def svg(self, title="Profil", width=1200, row=16) -> str:
+        # arbre d'appels : nom -> [échantillons, enfants]
+        root = [0, {}]
+        with self._lock:
+            for stack, c in self.stacks.items():
+                node = root
+                node[0] += c
+                for name in stack:
+                    node = node[1].setdefault(name, [0, {}])
+                    node[0] += c
+        total = root[0] or 1
+        rects = []
+        depth_max = [0]
+
+        def walk(node, name, x, depth):
+            w = node[0] / total * width
+            if w < 0.3:
+                return
+            depth_max[0] = max(depth_max[0], depth)
+            rects.append((x, depth, w, name, node[0]))
+            cx = x
+            for child_name, child in sorted(node[1].items()):
+                walk(child, child_name, cx, depth + 1)
+                cx += child[0] / total * width
+
+        walk(root, "all", 0.0, 0)
+        top = 30
+        height = top + (depth_max[0] + 1) * row + 10
+        out = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'font-family="Verdana,sans-serif" font-size="11">',
+            '<rect width="100%" height="100%" fill="#fdfdf8"/>',
+            f'<text x="{width / 2}" y="18" text-anchor="middle" font-size="14">'
+            f'{html.escape(title)} — {total} échantillons, {self.elapsed:.1f} s</text>',
+        ]
+        for x, depth, w, name, c in rects:
+            y = height - 10 - (depth + 1) * row      # racine en bas (flame graph)
+            hue = zlib.crc32(name.encode("utf-8")) % 55
+            label = html.escape(name)
+            tip = f"{label} — {c} échantillon(s), {100 * c / total:.1f} %"
+            out.append(
+                f'<g><title>{tip}</title><rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" '
+                f'fill="hsl({hue},85%,{58 + hue % 12}%)" rx="2"/>'
+            )
+            chars = int((w - 4) / 7)
+            if chars >= 3:
+                text = name if len(name) <= chars else name[:chars - 2] + ".."
+                out.append(f'<text x="{x + 2:.1f}" y="{y + row - 4}">{html.escape(text)}</text>')
+            out.append("</g>")
+        out.append("</svg>")
+        return "\n".join(out)
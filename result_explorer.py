@@ -0,0 +1,121 @@
+"""
+Explorateur paginé du résultat (tri, filtres, pages) côté serveur.
+
+Envoyer un tableau de 50 000 lignes à st.dataframe est lent ; ici tout est
+préparé une fois par résultat :
+  - une permutation de tri par colonne triable et par sens (np.argsort stable
+    dans les deux sens, ex æquo dans l'ordre d'origine, valeurs manquantes
+    toujours en fin) ;
+  - un masque booléen par valeur des colonnes peu variées (Pays, Type de
+    distance) ; les catégories passent par l'index inversé (CategoryIndex).
+Une requête combine les masques (ET logique), filtre la permutation du tri
+demandé et ne matérialise que la page affichée.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from category_index import CategoryIndex
+
+SORT_COLUMNS = ["Distance au projet", "Raison sociale", "Pays", "Code postal", "Référent MOA"]
+BITMAP_COLUMNS = ["Pays", "Type de distance"]
+PAGE_SIZES = (25, 50, 100, 250)
+
+
+def _text(series) -> np.ndarray:
+    return series.astype("object").where(series.notna(), "").astype(str).to_numpy()
+
+
+class ResultExplorer:
+    def __init__(self, df: pd.DataFrame, category_index: CategoryIndex = None):
+        self.df = df.reset_index(drop=True)
+        self.n = len(self.df)
+        self.category_index = category_index if category_index is not None else (
+            CategoryIndex.from_series(self.df["Catégories"]) if "Catégories" in self.df else None
+        )
+
+        # permutations de tri : (colonne, croissant) -> positions
+        self._perm = {}
+        for col in SORT_COLUMNS:
+            if col not in self.df:
+                continue
+            s = self.df[col]
+            if pd.api.types.is_numeric_dtype(s):
+                v = s.to_numpy(dtype="float64", na_value=np.nan)
+                missing = np.isnan(v)
+                self._perm[(col, True)] = np.argsort(np.where(missing, np.inf, v), kind="stable")
+                self._perm[(col, False)] = np.argsort(np.where(missing, np.inf, -v), kind="stable")
+            else:
+                # rang de chaque texte (ordre alphabétique) : le tri décroissant se fait
+                # sur le rang négatif, les ex æquo gardent l'ordre d'origine
+                v = np.char.lower(_text(s).astype(str))
+                uniques, rank = np.unique(v, return_inverse=True)
+                rank = rank.astype(np.int64)
+                missing = v == ""
+                self._perm[(col, True)] = np.argsort(np.where(missing, len(uniques), rank), kind="stable")
+                self._perm[(col, False)] = np.argsort(np.where(missing, 1, -rank), kind="stable")
+
+        # masques par valeur : colonne -> {valeur: masque booléen}
+        self._bitmaps = {}
+        for col in BITMAP_COLUMNS:
+            if col not in self.df:
+                continue
+            codes, uniques = pd.factorize(pd.Series(_text(self.df[col])), sort=True)
+            self._bitmaps[col] = {u: codes == i for i, u in enumerate(uniques) if u}
+
+        self._dist = (self.df["Distance au projet"].to_numpy(dtype="float64", na_value=np.nan)
+                      if "Distance au projet" in self.df else None)
+        self._names = pd.Series(np.char.lower(_text(self.df["Raison sociale"]).astype(str))) \
+            if "Raison sociale" in self.df else None
+
+    # ------------------------------------------------------------------ options
+    @property
+    def has_distances(self) -> bool:
+        return self._dist is not None and not np.isnan(self._dist).all()
+
+    def sort_columns(self) -> list:
+        return [c for c in SORT_COLUMNS if (c, True) in self._perm]
+
+    def values(self, col) -> list:
+        return list(self._bitmaps.get(col, {}))
+
+    def categories(self) -> list:
+        return self.category_index.categories() if self.category_index is not None else []
+
+    # ------------------------------------------------------------------ requêtes
+    def mask(self, filters=None, categories=(), match="any", max_km=None, text=""):
+        """Masque des lignes retenues. filters : {colonne: [valeurs]} sur BITMAP_COLUMNS."""
+        m = np.ones(self.n, dtype=bool)
+        for col, vals in (filters or {}).items():
+            maps = self._bitmaps.get(col, {})
+            if vals:
+                sel = np.zeros(self.n, dtype=bool)
+                for v in vals:
+                    if v in maps:
+                        sel |= maps[v]
+                m &= sel
+        if categories and self.category_index is not None:
+            m &= self.category_index.mask(categories, match)
+        if max_km and self._dist is not None:
+            with np.errstate(invalid="ignore"):
+                m &= self._dist <= max_km
+        if text and self._names is not None:
+            m &= self._names.str.contains(text.strip().lower(), regex=False).to_numpy()
+        return m
+
+    def query(self, sort="Distance au projet", ascending=True, **filters) -> np.ndarray:
+        """Positions des lignes retenues, dans l'ordre du tri."""
+        perm = self._perm.get((sort, ascending))
+        if perm is None:
+            perm = np.arange(self.n)
+        m = self.mask(**filters)
+        return perm[m[perm]]
+
+    def page(self, positions, page=1, size=PAGE_SIZES[0]) -> pd.DataFrame:
+        start = (max(1, page) - 1) * size
+        return self.df.take(positions[start:start + size])
+
+    @staticmethod
+    def n_pages(positions, size) -> int:
+        return max(1, math.ceil(len(positions) / size))
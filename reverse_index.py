@@ -0,0 +1,121 @@
+"""
+Géocodage inverse hors ligne : (lat, lon) -> (pays, code postal le plus proche).
+
+Les points de codes postaux GeoNames (data/postcodes.csv, à défaut le gazetier
+FR/BE/LU) sont rangés dans une grille régulière de CELL_DEG degrés, stockée en
+tableaux triés (ordre des points + début de chaque cellule). Une recherche
+parcourt la cellule du point puis des anneaux de cellules voisines jusqu'à
+trouver le point le plus proche : coût quasi constant, sans appel réseau.
+
+Les frontières sont approchées par le diagramme de Voronoï des codes postaux
+(le pays est celui du code postal le plus proche) ; au-delà de MAX_KM (mer,
+pays absent du fichier), aucune réponse n'est donnée.
+"""
+import csv
+import math
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from commune_index import GAZETTEER_PATH
+
+POSTCODES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "postcodes.csv")
+CELL_DEG = 0.1          # ~11 km en latitude
+MAX_KM = 25.0           # au-delà, le point est considéré hors couverture
+
+# Codes ISO (GeoNames, Nominatim "country_code") -> libellés utilisés dans les exports
+COUNTRY_NAMES = {
+    "FR": "France", "BE": "Belgique", "LU": "Luxembourg", "NL": "Pays-Bas",
+    "ES": "Espagne", "IT": "Italie", "CH": "Suisse", "DE": "Allemagne",
+    "PT": "Portugal", "SK": "Slovaquie",
+}
+
+
+def country_name(code, default=""):
+    """'nl' -> 'Pays-Bas' ; code inconnu ou vide -> default."""
+    return COUNTRY_NAMES.get(str(code or "").upper(), default)
+
+
+class ReverseIndex:
+    def __init__(self, records):
+        countries, cps, lat, lon = [], [], [], []
+        for country, cp, la, lo in records:
+            countries.append(country)
+            cps.append(str(cp))
+            lat.append(float(la))
+            lon.append(float(lo))
+        self.country = countries
+        self.cp = cps
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+
+        # grille : clé de cellule -> tranche [start, end) de self.order
+        ci = np.floor(self.lat / CELL_DEG).astype(np.int64)
+        cj = np.floor(self.lon / CELL_DEG).astype(np.int64)
+        keys = ci * 100_000 + cj
+        self.order = np.argsort(keys, kind="stable").astype(np.int32)
+        sorted_keys = keys[self.order]
+        uniq, starts = np.unique(sorted_keys, return_index=True)
+        ends = np.append(starts[1:], len(sorted_keys))
+        self.cells = {int(k): (int(s), int(e)) for k, s, e in zip(uniq, starts, ends)}
+
+    def __len__(self):
+        return len(self.cp)
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = [(r["pays"], r["code_postal"], r["lat"], r["lon"]) for r in csv.DictReader(f)]
+        return cls(rows)
+
+    def _cell_points(self, i, j):
+        span = self.cells.get(i * 100_000 + j)
+        return self.order[span[0]:span[1]] if span else None
+
+    def lookup(self, lat, lon, max_km=MAX_KM):
+        """(pays, code postal, distance km) du code postal le plus proche, ou None."""
+        if lat is None or lon is None or not len(self.cp):
+            return None
+        i0, j0 = math.floor(lat / CELL_DEG), math.floor(lon / CELL_DEG)
+        cos_lat = max(math.cos(math.radians(lat)), 0.1)
+        ring_km = CELL_DEG * 111.2 * cos_lat          # largeur minimale d'un anneau
+        max_ring = int(max_km / ring_km) + 1
+        best, best_km = None, float("inf")
+        for r in range(max_ring + 1):
+            # un point trouvé à d km ne peut être battu que dans les anneaux < d / largeur d'anneau
+            if best is not None and (r - 1) * ring_km > best_km:
+                break
+            cand = []
+            for i in range(i0 - r, i0 + r + 1):
+                for j in (range(j0 - r, j0 + r + 1) if abs(i - i0) == r else (j0 - r, j0 + r)):
+                    pts = self._cell_points(i, j)
+                    if pts is not None:
+                        cand.append(pts)
+                if r == 0:
+                    break
+            if not cand:
+                continue
+            ids = np.concatenate(cand)
+            dx = np.radians(self.lon[ids] - lon) * cos_lat
+            dy = np.radians(self.lat[ids] - lat)
+            d = 6371.0 * np.hypot(dx, dy)
+            k = int(np.argmin(d))
+            if d[k] < best_km:
+                best, best_km = int(ids[k]), float(d[k])
+        if best is None or best_km > max_km:
+            return None
+        return self.country[best], self.cp[best], round(best_km, 2)
+
+
+@lru_cache(maxsize=1)
+def get_reverse_index(path=None):
+    """Index partagé (chargé une fois par processus) ; None sans fichier de codes postaux."""
+    for p in ([path] if path else [POSTCODES_PATH, GAZETTEER_PATH]):
+        if p and os.path.exists(p):
+            try:
+                return ReverseIndex.from_csv(p)
+            except Exception as e:
+                print(f"⚠️ Index inverse illisible ({p}) : {e}")
+                return None
+    return None
@@ -0,0 +1,126 @@
+"""
+Estimation calibrée de la distance routière à partir de la distance à vol d'oiseau.
+
+Le vol d'oiseau sous-estime la route de 20 à 40 %, mais de façon assez régulière
+pour une région et une tranche de distance données. Chaque distance OSRM
+obtenue alimente, pour sa (région, tranche), les statistiques du facteur de
+détour log(route / vol d'oiseau) (moyenne et variance en ligne, Welford).
+L'estimation est alors instantanée et accompagnée d'un intervalle de confiance ;
+on n'appelle le routeur que lorsque l'intervalle est trop large ou qu'il
+chevauche la distance seuil choisie par l'utilisateur.
+"""
+import json
+import math
+import os
+import tempfile
+import threading
+from functools import lru_cache
+
+BANDS_KM = (10, 25, 50, 100, 200, 400)      # bornes supérieures des tranches ; au-delà : dernière tranche
+MIN_SAMPLES = 8                             # échantillons minimum pour faire confiance à une cellule
+Z = 1.645                                   # intervalle à 90 %
+REL_TOLERANCE = 0.25                        # largeur relative max de l'intervalle sans seuil
+AUTOSAVE_EVERY = 25
+_SAVE_LOCK = threading.Lock()     # sessions et tâches du même serveur écrivent le même fichier
+
+
+def band_of(geo_km: float) -> str:
+    for b in BANDS_KM:
+        if geo_km < b:
+            return f"<{b}"
+    return f">={BANDS_KM[-1]}"
+
+
+def region_of(country: str, cp: str) -> str:
+    """Département pour la France (2 premiers chiffres du CP), sinon le pays."""
+    country = (country or "").strip()
+    cp = str(cp or "").strip()
+    if (not country or country.lower() == "france") and cp[:2].isdigit():
+        return f"FR-{cp[:2]}"
+    return country or "?"
+
+
+class RoadEstimator:
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = 0
+        self.cells = {}     # "région|tranche" ou "*|tranche" -> [n, moyenne, M2] du log-ratio
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.cells = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Calibration routière illisible ({path}) : {e}")
+
+    def learn(self, geo_km: float, road_km: float, region: str = ""):
+        """Ajoute un couple (vol d'oiseau, route) observé."""
+        if not geo_km or not road_km or geo_km < 0.5 or road_km < geo_km * 0.9:
+            return
+        x = math.log(road_km / geo_km)
+        band = band_of(geo_km)
+        with self._lock:
+            for key in (f"{region}|{band}", f"*|{band}"):
+                n, mean, m2 = self.cells.get(key, [0, 0.0, 0.0])
+                n += 1
+                delta = x - mean
+                mean += delta / n
+                m2 += delta * (x - mean)
+                self.cells[key] = [n, mean, m2]
+            self._dirty += 1
+            autosave = self._dirty >= AUTOSAVE_EVERY
+        if autosave:
+            self.save()
+
+    def estimate(self, geo_km: float, region: str = ""):
+        """
+        (estimation, borne basse, borne haute, n) en km, ou None faute d'échantillons.
+        La cellule (région, tranche) est préférée ; sinon la tranche toutes régions.
+        """
+        band = band_of(geo_km)
+        with self._lock:
+            for key in (f"{region}|{band}", f"*|{band}"):
+                n, mean, m2 = self.cells.get(key, [0, 0.0, 0.0])
+                if n >= MIN_SAMPLES:
+                    break
+            else:
+                return None
+        sd = math.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+        # incertitude de prédiction : dispersion + erreur sur la moyenne
+        spread = Z * sd * math.sqrt(1 + 1 / n)
+        est = geo_km * math.exp(mean)
+        lo = max(geo_km, geo_km * math.exp(mean - spread))
+        hi = geo_km * math.exp(mean + spread)
+        return est, lo, hi, n
+
+    @staticmethod
+    def is_ambiguous(est, lo, hi, cutoff_km=None, rel_tolerance=REL_TOLERANCE) -> bool:
+        """Faut-il router ? Oui si l'intervalle chevauche le seuil, ou (sans seuil) s'il est trop large."""
+        if cutoff_km:
+            return lo <= cutoff_km <= hi
+        return (hi - lo) > rel_tolerance * est
+
+    def save(self):
+        if not self.path:
+            return
+        # instantané pris sous le verrou d'écriture : un état plus ancien n'écrase jamais un plus récent
+        with _SAVE_LOCK:
+            with self._lock:
+                data = json.dumps(self.cells)
+                self._dirty = 0
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                       prefix=f".{os.path.basename(self.path)}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp, self.path)
+            except Exception as e:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                print(f"⚠️ Calibration routière non sauvegardée ({self.path}) : {e}")
+
+
+@lru_cache(maxsize=None)
+def get_estimator(path) -> RoadEstimator:
+    """Estimateur partagé par toutes les sessions du processus."""
+    return RoadEstimator(path)
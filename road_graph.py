@@ -0,0 +1,433 @@
+"""
+Routage routier hors ligne sur un graphe prétraité (France et pays voisins).
+
+Le graphe est stocké en tableaux CSR (.npy) ouverts en mémoire mappée : le
+chargement est instantané et seules les pages parcourues sont lues.
+
+    <dossier>/lat.npy, lon.npy     coordonnées des nœuds (float32)
+    <dossier>/indptr.npy           début des arcs sortants de chaque nœud (int32)
+    <dossier>/indices.npy          nœud d'arrivée de chaque arc (int32)
+    <dossier>/weights.npy          longueur de chaque arc en mètres (float64)
+    <dossier>/cell_keys.npy        clés de grille triées (int64) ...
+    <dossier>/cell_order.npy       ... et nœuds correspondants (int32), pour l'accroche
+
+Toutes les distances d'un run partent de la même adresse de projet : un seul
+Dijkstra depuis la base sert tous les fournisseurs (distances_km, par lot).
+La recherche est bornée : elle s'arrête à DETOUR_CAP fois le vol d'oiseau de
+la cible la plus lointaine (un fournisseur au-delà repasse par OSRM ou
+l'estimation calibrée), jamais sur tout le continent. L'état de la recherche
+est en tableaux (distances float64, nœuds fixés en octets), pas en dict.
+
+Avec scipy, la recherche est celle de scipy.sparse.csgraph (compilée) ; sans
+scipy, un Dijkstra pur Python reprenable donne les mêmes distances, plus
+lentement. Les types des tableaux sont ceux de csgraph (indices int32, int64
+au-delà de 2^31 arcs ; longueurs float64) : la matrice scipy repose directement
+sur les fichiers mappés, sans copie en mémoire ni conversion à chaque recherche.
+
+Construction depuis une liste d'arcs (export OSM d'osmnx, pyrosm, ogr2ogr...),
+et démonstration sur un graphe synthétique (contrôle contre un Dijkstra de
+référence, chronométrage) :
+
+    python road_graph.py build nodes.csv edges.csv -o data/road_graph
+    python road_graph.py demo --size 200
+
+nodes.csv : id, lat, lon          edges.csv : u, v[, length_m][, oneway]
+"""
+import argparse
+import csv
+import heapq
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+except ImportError:         # moteur pur Python, mêmes résultats
+    csr_matrix = csgraph_dijkstra = None
+
+ROAD_GRAPH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "road_graph")
+CELL_DEG = 0.05         # ~5,5 km en latitude
+SNAP_MAX_KM = 5.0       # au-delà, le point est hors du graphe (pas de réponse)
+DETOUR_CAP = 3.0        # recherche bornée à DETOUR_CAP × vol d'oiseau (+ CAP_SLACK_KM) de la cible la plus lointaine
+CAP_SLACK_KM = 20.0
+MAX_SEARCHES = 2        # recherches gardées en cache (une par adresse de projet)
+FILES = ("lat", "lon", "indptr", "indices", "weights", "cell_keys", "cell_order")
+
+
+def _index_dtype(n_nodes, n_arcs):
+    """Type des indices CSR retenu par scipy : int32 tant qu'il suffit."""
+    return np.int32 if max(n_nodes, n_arcs) < 2 ** 31 else np.int64
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _cell_keys(lat, lon):
+    ci = np.floor(np.asarray(lat, dtype=np.float64) / CELL_DEG).astype(np.int64)
+    cj = np.floor(np.asarray(lon, dtype=np.float64) / CELL_DEG).astype(np.int64)
+    return ci * 100_000 + cj
+
+
+# ============================ CONSTRUCTION ============================
+def _largest_component(n, src, dst):
+    """Masque des nœuds de la plus grande composante (arcs pris sans orientation)."""
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    adj = dst[order]
+    label = np.full(n, -1, dtype=np.int32)
+    sizes = []
+    for start in range(n):
+        if label[start] >= 0:
+            continue
+        c = len(sizes)
+        label[start] = c
+        stack, size = [start], 0
+        while stack:
+            u = stack.pop()
+            size += 1
+            for v in adj[indptr[u]:indptr[u + 1]].tolist():
+                if label[v] < 0:
+                    label[v] = c
+                    stack.append(v)
+        sizes.append(size)
+    return label == int(np.argmax(sizes)) if sizes else np.zeros(n, dtype=bool)
+
+
+def build_graph(nodes, edges, out_dir, keep_largest=True):
+    """
+    nodes : itérable de (id, lat, lon) ; edges : itérable de (u, v, longueur_m ou None, sens_unique).
+    Longueur absente : distance à vol d'oiseau entre les deux nœuds. Écrit les
+    tableaux CSR dans out_dir et renvoie (nb nœuds, nb arcs).
+    """
+    ids, lat, lon = [], [], []
+    for nid, la, lo in nodes:
+        ids.append(str(nid))
+        lat.append(float(la))
+        lon.append(float(lo))
+    pos = {nid: i for i, nid in enumerate(ids)}
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+
+    src, dst, length = [], [], []
+    for u, v, m, oneway in edges:
+        a, b = pos.get(str(u)), pos.get(str(v))
+        if a is None or b is None or a == b:
+            continue
+        if m in (None, ""):
+            m = float(_haversine_km(lat[a], lon[a], lat[b], lon[b])) * 1000.0
+        src.append(a); dst.append(b); length.append(float(m))
+        if not oneway:
+            src.append(b); dst.append(a); length.append(float(m))
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    length = np.asarray(length, dtype=np.float64)
+
+    # îlots isolés (parkings, voies privées) : un point accroché dessus serait injoignable
+    if keep_largest and len(ids):
+        keep = _largest_component(len(ids), np.concatenate([src, dst]), np.concatenate([dst, src]))
+        new_id = np.cumsum(keep) - 1
+        e = keep[src] & keep[dst]
+        src, dst, length = new_id[src[e]], new_id[dst[e]], length[e]
+        lat, lon = lat[keep], lon[keep]
+
+    n = len(lat)
+    order = np.lexsort((dst, src))
+    index_dtype = _index_dtype(n, len(order))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    keys = _cell_keys(lat, lon)
+    cell_order = np.argsort(keys, kind="stable")
+
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {
+        "lat": lat.astype(np.float32), "lon": lon.astype(np.float32),
+        "indptr": indptr.astype(index_dtype), "indices": dst[order].astype(index_dtype), "weights": length[order],
+        "cell_keys": keys[cell_order], "cell_order": cell_order.astype(np.int32),
+    }
+    for name in FILES:
+        np.save(os.path.join(out_dir, f"{name}.npy"), arrays[name])
+    return n, len(order)
+
+
+# ============================ RECHERCHE ============================
+class _Search:
+    """
+    Dijkstra depuis un nœud, borné à `limit` mètres. Sans scipy : tas et tableaux
+    conservés entre deux lots (la recherche reprend où elle s'était arrêtée).
+    """
+
+    def __init__(self, graph, source):
+        self.graph = graph
+        self.source = source
+        self.limit = 0.0
+        self.lock = threading.Lock()
+        if csgraph_dijkstra is None:
+            self.dist = array("d", [math.inf]) * len(graph)
+            self.settled = bytearray(len(graph))
+            self.dist[source] = 0.0
+            self.heap = [(0.0, source)]
+        else:
+            self.dist = None
+
+    def extend(self, targets, limit):
+        """Fixe les cibles atteignables à moins de `limit` mètres."""
+        if csgraph_dijkstra is not None:
+            if limit > self.limit:
+                self.dist = csgraph_dijkstra(self.graph.csr, indices=self.source, limit=limit)
+                self.limit = limit
+            return
+        self.limit = max(self.limit, limit)
+        dist, settled, heap = self.dist, self.settled, self.heap
+        pending = {t for t in targets if not settled[t]}
+        indptr, indices, weights = self.graph.indptr, self.graph.indices, self.graph.weights
+        while pending and heap and heap[0][0] <= limit:
+            d, u = heapq.heappop(heap)
+            if settled[u]:
+                continue
+            settled[u] = 1
+            pending.discard(u)
+            lo, hi = int(indptr[u]), int(indptr[u + 1])
+            for v, w in zip(indices[lo:hi].tolist(), weights[lo:hi].tolist()):
+                nd = d + w
+                if nd < dist[v]:
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+
+    def distance(self, node):
+        """Distance définitive (m) jusqu'au nœud, ou None s'il n'est pas atteint dans la borne."""
+        if csgraph_dijkstra is not None:
+            d = float(self.dist[node])
+            return d if d <= self.limit else None
+        return self.dist[node] if self.settled[node] else None
+
+
+class RoadGraph:
+    def __init__(self, path=ROAD_GRAPH_PATH, mmap=True):
+        mode = "r" if mmap else None
+        a = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in FILES}
+        self.lat, self.lon = a["lat"], a["lon"]
+        self.indptr, self.indices, self.weights = a["indptr"], a["indices"], a["weights"]
+        self.cell_keys, self.cell_order = a["cell_keys"], a["cell_order"]
+        self._csr = None
+        self._searches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def csr(self):
+        """
+        Matrice d'adjacence scipy (construite une fois) sur les tableaux mappés
+        eux-mêmes. Un graphe construit avant le passage aux types de csgraph
+        (indptr int64, longueurs float32) est converti ici, une fois.
+        """
+        if self._csr is None:
+            n = len(self)
+            index_dtype = _index_dtype(n, len(self.indices))
+            self._csr = csr_matrix((self.weights.astype(np.float64, copy=False),
+                                    self.indices.astype(index_dtype, copy=False),
+                                    self.indptr.astype(index_dtype, copy=False)),
+                                   shape=(n, n), copy=False)
+        return self._csr
+
+    # ------------------------------------------------------------------ accroche
+    def _cell_nodes(self, i, j):
+        k = i * 100_000 + j
+        lo = int(np.searchsorted(self.cell_keys, k, side="left"))
+        hi = int(np.searchsorted(self.cell_keys, k, side="right"))
+        return self.cell_order[lo:hi] if hi > lo else None
+
+    def nearest_node(self, lat, lon, max_km=SNAP_MAX_KM):
+        """(nœud, distance km) du nœud le plus proche, ou None au-delà de max_km."""
+        if lat is None or lon is None or not len(self):
+            return None
+        i0, j0 = math.floor(lat / CELL_DEG), math.floor(lon / CELL_DEG)
+        ring_km = CELL_DEG * 111.2 * max(math.cos(math.radians(lat)), 0.1)
+        best, best_km = None, float("inf")
+        for r in range(int(max_km / ring_km) + 2):
+            if best is not None and (r - 1) * ring_km > best_km:
+                break
+            cand = []
+            for i in range(i0 - r, i0 + r + 1):
+                for j in (range(j0 - r, j0 + r + 1) if abs(i - i0) == r else (j0 - r, j0 + r)):
+                    pts = self._cell_nodes(i, j)
+                    if pts is not None:
+                        cand.append(pts)
+                if r == 0:
+                    break
+            if not cand:
+                continue
+            ids = np.concatenate(cand)
+            d = _haversine_km(lat, lon, self.lat[ids], self.lon[ids])
+            k = int(np.argmin(d))
+            if d[k] < best_km:
+                best, best_km = int(ids[k]), float(d[k])
+        if best is None or best_km > max_km:
+            return None
+        return best, best_km
+
+    # ------------------------------------------------------------------ Dijkstra
+    def _search(self, source):
+        with self._lock:
+            s = self._searches.get(source)
+            if s is None:
+                s = self._searches[source] = _Search(self, source)
+                if len(self._searches) > MAX_SEARCHES:
+                    self._searches.popitem(last=False)
+            else:
+                self._searches.move_to_end(source)
+            return s
+
+    def distances_km(self, source_coords, targets, max_snap_km=SNAP_MAX_KM, max_km=None):
+        """
+        Distances routières (km) de source_coords vers chaque (lat, lon) de targets,
+        en une seule recherche bornée. None pour un point hors du graphe, injoignable
+        ou au-delà de la borne (DETOUR_CAP × vol d'oiseau, ou max_km).
+        """
+        src = self.nearest_node(source_coords[0], source_coords[1], max_snap_km)
+        if src is None:
+            return [None] * len(targets)
+        snapped = [self.nearest_node(t[0], t[1], max_snap_km) if t else None for t in targets]
+        nodes = [t[0] for t in snapped if t is not None]
+        if not nodes:
+            return [None] * len(targets)
+        geo = _haversine_km(self.lat[src[0]], self.lon[src[0]], self.lat[nodes], self.lon[nodes])
+        limit_km = DETOUR_CAP * float(np.max(geo)) + CAP_SLACK_KM
+        if max_km:
+            limit_km = min(limit_km, max_km)
+        s = self._search(src[0])
+        with s.lock:
+            s.extend(nodes, limit_km * 1000.0)
+            out = []
+            for t in snapped:
+                d = s.distance(t[0]) if t is not None else None
+                out.append(None if d is None else src[1] + d / 1000.0 + t[1])
+        return out
+
+    def route_km(self, source_coords, target_coords):
+        return self.distances_km(source_coords, [target_coords])[0]
+
+
+@lru_cache(maxsize=1)
+def get_road_graph(path=None):
+    """Graphe partagé (ouvert une fois par processus) ; None sans graphe prétraité."""
+    path = path or ROAD_GRAPH_PATH
+    if not os.path.exists(os.path.join(path, "indptr.npy")):
+        return None
+    try:
+        return RoadGraph(path)
+    except Exception as e:
+        print(f"⚠️ Graphe routier illisible ({path}) : {e}")
+        return None
+
+
+# ============================ DÉMONSTRATION ============================
+def synthetic_grid(size, step_deg=0.01, origin=(45.0, 4.0), seed=0):
+    """
+    Quadrillage routier synthétique size × size : longueurs aléatoires (0,8 à
+    3 km, ou vol d'oiseau), 10 % de sens uniques. Renvoie (nodes, edges) pour build_graph.
+    """
+    rnd = random.Random(seed)
+    nodes = [(f"{i}_{j}", origin[0] + i * step_deg, origin[1] + j * step_deg)
+             for i in range(size) for j in range(size)]
+    edges = []
+    for i in range(size):
+        for j in range(size):
+            if j + 1 < size:
+                edges.append((f"{i}_{j}", f"{i}_{j + 1}", None if rnd.random() < 0.5 else rnd.uniform(800, 3000), False))
+            if i + 1 < size:
+                edges.append((f"{i}_{j}", f"{i + 1}_{j}", rnd.uniform(1100, 3000), rnd.random() < 0.1))
+    return nodes, edges
+
+
+def _reference_km(graph, source):
+    """Dijkstra de référence, sans borne ni reprise (contrôle de la démonstration)."""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for k in range(int(graph.indptr[u]), int(graph.indptr[u + 1])):
+            v, nd = int(graph.indices[k]), d + float(graph.weights[k])
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+
+def demo(size=200, n_targets=2000, seed=0):
+    """Construit un graphe synthétique, compare au Dijkstra de référence et chronomètre."""
+    rnd = random.Random(seed)
+    with tempfile.TemporaryDirectory() as d:
+        t0 = time.perf_counter()
+        n, m = build_graph(*synthetic_grid(size, seed=seed), d)
+        print(f"graphe : {n} nœuds, {m} arcs, construit en {time.perf_counter() - t0:.2f} s")
+        graph = RoadGraph(d)
+        span = (size - 1) * 0.01
+        base = (45.0 + span / 2, 4.0 + span / 2)
+        targets = [(45.0 + rnd.random() * span, 4.0 + rnd.random() * span) for _ in range(n_targets)]
+        engine = "scipy.sparse.csgraph" if csgraph_dijkstra is not None else "pur Python"
+        t0 = time.perf_counter()
+        got = graph.distances_km(base, targets)
+        dt = time.perf_counter() - t0
+        print(f"{n_targets} cibles en un lot ({engine}) : {dt:.2f} s, {n_targets / dt:.0f} fournisseurs/s")
+
+        src = graph.nearest_node(*base)
+        ref = _reference_km(graph, src[0])
+        worst = 0.0
+        for t, g in zip(targets, got):
+            node, snap_km = graph.nearest_node(*t)
+            expected = src[1] + ref[node] / 1000.0 + snap_km
+            worst = max(worst, abs((g if g is not None else math.inf) - expected))
+        print(f"écart max avec le Dijkstra de référence : {worst:.6f} km")
+        return worst < 1e-6
+
+
+# ============================ CLI ============================
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Graphe routier hors ligne : prétraitement et démonstration.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="prétraite une liste d'arcs")
+    b.add_argument("nodes", help="CSV id, lat, lon")
+    b.add_argument("edges", help="CSV u, v[, length_m][, oneway]")
+    b.add_argument("-o", "--out", default=ROAD_GRAPH_PATH)
+    b.add_argument("--keep-islands", action="store_true", help="garder les composantes isolées")
+    d = sub.add_parser("demo", help="graphe synthétique : contrôle et chronométrage")
+    d.add_argument("--size", type=int, default=200, help="côté du quadrillage (nœuds)")
+    d.add_argument("--targets", type=int, default=2000)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "demo":
+        ok = demo(args.size, args.targets)
+        print("✅ distances identiques" if ok else "❌ distances différentes")
+        raise SystemExit(0 if ok else 1)
+
+    nodes = ((r["id"], r["lat"], r["lon"]) for r in _read_csv(args.nodes))
+    edges = ((r["u"], r["v"], r.get("length_m"), str(r.get("oneway", "")).strip().lower() in ("1", "true", "yes"))
+             for r in _read_csv(args.edges))
+    n, m = build_graph(nodes, edges, args.out, keep_largest=not args.keep_islands)
+    print(f"✅ {n} nœuds, {m} arcs -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Coalescence des requêtes et budget de débit partagés par tout le processus.
+
+Streamlit exécute chaque session dans un thread du même processus : deux
+collègues qui chargent des fichiers qui se recoupent déclenchent les mêmes
+géocodages au même moment. SingleFlight fait partager un seul appel en vol (et
+son résultat) entre appels identiques concurrents ; FairRateLimiter distribue un
+débit unique (ex. 1 requête / 1,1 s pour Nominatim) à tour de rôle entre les
+sessions, pour qu'un gros fichier n'affame pas les autres utilisateurs.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0          # appels servis par un appel déjà en vol
+
+    def do(self, key, fn):
+        """Exécute fn() une seule fois pour tous les appelants concurrents de même clé."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.shared += 1
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.event.set()
+        else:
+            call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class FairRateLimiter:
+    """
+    Au plus un jeton toutes les `interval` secondes pour tout le processus,
+    attribués à tour de rôle (round-robin) entre les propriétaires en attente.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()    # propriétaire -> deque de tickets, dans l'ordre de passage
+        self._next_time = 0.0
+
+    def acquire(self, owner="default"):
+        ticket = object()
+        with self._cond:
+            self._queues.setdefault(owner, deque()).append(ticket)
+            while True:
+                first_owner = next(iter(self._queues))
+                my_turn = first_owner == owner and self._queues[owner][0] is ticket
+                now = time.monotonic()
+                if my_turn and now >= self._next_time:
+                    q = self._queues[owner]
+                    q.popleft()
+                    if q:
+                        self._queues.move_to_end(owner)     # au suivant
+                    else:
+                        del self._queues[owner]
+                    self._next_time = now + self.interval
+                    self._cond.notify_all()
+                    return
+                self._cond.wait(timeout=(self._next_time - now) if my_turn else None)
+
+    def waiting(self) -> dict:
+        with self._cond:
+            return {o: len(q) for o, q in self._queues.items()}
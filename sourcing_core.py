@@ -0,0 +1,1517 @@
+"""
+Cœur du pipeline sourcing MOA : lecture du CSV, géocodage, sélection des
+sites, distances, exports Excel et carte Folium.
+L'interface Streamlit (app_moa_distance_map_full.py) s'appuie sur ce module.
+Streamlit n'y sert qu'au cache (st.cache_data) et aux messages destinés à
+l'utilisateur (notify) ; hors page (tâches d'arrière-plan), collect_notices
+les recueille.
+"""
+import streamlit as st
+import pandas as pd
+import numpy as np
+import csv, os, re, threading, time, unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from io import BytesIO
+from geopy.distance import geodesic
+from openpyxl import load_workbook
+import folium
+from folium.features import DivIcon
+import supplier_master as sm
+from category_index import write_category_sheets
+from commune_index import GAZETTEER_PATH, get_resolver
+from reverse_index import country_name, get_reverse_index
+from singleflight import SingleFlight, FairRateLimiter
+from road_estimator import get_estimator, region_of
+from road_graph import get_road_graph
+from geocoders import BanCsvGeocoder, NominatimGeocoder
+from geocode_ladder import address_shape, split_street, get_stats as get_ladder_stats
+
+# ========================== CONFIG ==========================
+TEMPLATE_PATH = "Sourcing base.xlsx"   # modèle Excel avec en-têtes
+START_ROW = 11                         # 1re ligne de data dans le modèle
+MASTER_PATH = "supplier_master.parquet" # référentiel fournisseurs (réutilisé d'un export à l'autre)
+COMMUNE_CONFIDENCE = 0.85              # seuil de confiance du gazetier hors ligne avant appel réseau
+LADDER_STATS_PATH = "geocode_ladder.json" # taux de succès des variantes de géocodage (appris)
+ROAD_CALIBRATION_PATH = "road_calibration.json" # facteurs de détour route / vol d'oiseau (appris)
+NOMINATIM_INTERVAL = float(os.environ.get("MOA_NOMINATIM_INTERVAL", 1.1))  # s entre deux requêtes Nominatim, toutes sessions confondues
+OSRM_INTERVAL = float(os.environ.get("MOA_OSRM_INTERVAL", 1.0))            # idem pour le serveur OSRM de démonstration (1 req/s max)
+# Serveurs (surchargeables pour une instance privée ou les bouchons de loadtest.py)
+NOMINATIM_DOMAIN = os.environ.get("MOA_NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+NOMINATIM_SCHEME = os.environ.get("MOA_NOMINATIM_SCHEME", "https")
+OSRM_URL = os.environ.get("MOA_OSRM_URL", "http://router.project-osrm.org").rstrip("/")
+BAN_URL = os.environ.get("MOA_BAN_URL", "https://api-adresse.data.gouv.fr")  # "" : pas de géocodage en masse
+ROAD_GRAPH_PATH = os.environ.get("MOA_ROAD_GRAPH")   # graphe routier prétraité (défaut : data/road_graph)
+MY_USER_AGENT = "app_sourcing_jarod6999"   # ⚠️ REMPLACE CECI PAR TON EMAIL PRO POUR NE PLUS JAMAIS ETRE BLOQUÉ
+
+# Budgets partagés par toutes les sessions du serveur (module importé une seule fois)
+FLIGHTS = SingleFlight()
+NOMINATIM_LIMITER = FairRateLimiter(NOMINATIM_INTERVAL)
+OSRM_LIMITER = FairRateLimiter(OSRM_INTERVAL)
+# Géocodeur en masse des adresses françaises (avant la chaîne unitaire Nominatim)
+BULK_GEOCODER = BanCsvGeocoder(BAN_URL) if BAN_URL else None
+# Routage hors ligne (road_graph.py) ; None sans graphe : OSRM comme avant
+ROAD_GRAPH = get_road_graph(ROAD_GRAPH_PATH)
+# Gazetier des communes (build_gazetteer.py, non fourni) : sans lui, tout passe par le réseau
+if not os.path.exists(GAZETTEER_PATH):
+    print(f"ℹ️ Gazetier absent ({GAZETTEER_PATH}) : résolution hors ligne des communes désactivée "
+          f"(le générer avec build_gazetteer.py)")
+
+# Représentation interne compacte : chaînes Arrow, catégories pour les colonnes répétitives
+TEXT_DTYPE = pd.StringDtype("pyarrow")
+RESULT_COLUMNS = [
+    "Raison sociale", "Pays", "Adresse", "Code postal", "Distance au projet",
+    "Catégories", "Référent MOA", "Contact MOA", "Type de distance", "Fiabilité géocode",
+    "Latitude", "Longitude",
+]
+NUMERIC_COLUMNS = ["Distance au projet", "Latitude", "Longitude"]
+CATEGORICAL_COLUMNS = ["Pays", "Catégories", "Type de distance", "Fiabilité géocode"]
+ROAD_TYPES = ("API OSRM", "Graphe routier local")   # distances déjà routières (pas à refaire)
+ESTIMATE_TYPE = "Estimation calibrée"   # revérifiée à chaque run : le seuil (cutoff_km) peut avoir changé
+# Fiabilité géocode des lignes approchées faute de temps (mode délai)
+PRECISION_BULK = "adresse (API Adresse, délai)"
+PRECISION_COMMUNE = "commune (délai)"
+PRECISION_NONE = "non géocodé (délai)"
+DEGRADED_PRECISIONS = (PRECISION_BULK, PRECISION_COMMUNE, PRECISION_NONE)
+
+# ====================== GEO & HELPERS =======================
+COUNTRY_WORDS = {
+    "france","belgique","belgium","belgie","belgië","espagne","españa","portugal",
+    "italie","italia","deutschland","germany","suisse","switzerland","luxembourg",
+    "pays-bas","pays bas","netherlands","nederland"
+}
+CP_FALLBACK_RE = re.compile(r"\b\d{4,6}\b")
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}")
+
+INDUS_TOKENS = ["implant-indus-2","implant-indus-3","implant-indus-4","implant-indus-5"]
+HQ_TOKEN     = "adresse-du-siège"
+
+import requests
+
+# ================== VERIFICATION CLE ORS ==================
+
+def ors_distance(coord1, coord2, ors_key=""):
+    """
+    Essaie de calculer la distance routière (driving-car) via OpenRouteService.
+    Si la requête échoue ou que la clé est absente, renvoie None.
+    """
+    if not coord1 or not coord2 or not ors_key:
+        return None
+    url = "https://api.openrouteservice.org/v2/directions/driving-car"
+    headers = {"Authorization": ors_key, "Content-Type": "application/json"}
+    data = {"coordinates": [[coord1[1], coord1[0]], [coord2[1], coord2[0]]]}
+    try:
+        r = requests.post(url, json=data, headers=headers, timeout=30)
+        if r.status_code == 200:
+            js = r.json()
+            return js["routes"][0]["summary"]["distance"] / 1000.0  # km
+        else:
+            print(f"⚠️ ORS error {r.status_code}: {r.text[:200]}")
+    except Exception as e:
+        print(f"⚠️ ORS request failed: {e}")
+    return None
+
+
+def _norm(text: str) -> str:
+    if not isinstance(text,str): return ""
+    text = unicodedata.normalize("NFKC", text)
+    text = text.replace("’","'").replace("–","-").replace("—","-")
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+def _fix_postcode_spaces(text: str) -> str:
+    # "40 300" -> "40300", "75 018" -> "75018"
+    return re.sub(r"\b(\d{2})\s?(\d{3})\b", r"\1\2", text)
+
+def has_explicit_country(s: str) -> bool:
+    return any(w in s.lower() for w in COUNTRY_WORDS)
+
+def extract_cp_fallback(text: str) -> str:
+    if not isinstance(text, str): return ""
+    t = _fix_postcode_spaces(_norm(text))
+    m = CP_FALLBACK_RE.search(t)
+    return m.group(0) if m else ""
+
+def extract_cp_city(text: str):
+    """Essaie d'extraire (cp, ville) FR/BE à partir de l'adresse brute."""
+    if not isinstance(text,str): return ("","")
+    t = _fix_postcode_spaces(_norm(text))
+    # pattern 1: '40300 Hastingues'
+    m = re.search(r"\b(\d{4,5})\b[ ,\-]*([A-Za-zÀ-ÖØ-öø-ÿ' \-]{2,})", t)
+    if m:
+        cp = m.group(1)
+        ville = m.group(2).split(",")[0].strip()
+        ville = re.sub(r"\bcedex\b.*$", "", ville, flags=re.I).strip()
+        return (cp, ville)
+    # pattern 2: 'Hastingues 40300'
+    m = re.search(r"([A-Za-zÀ-ÖØ-öø-ÿ' \-]{2,})[ ,\-]*(\d{4,5})\b", t)
+    if m:
+        ville = m.group(1).split(",")[0].strip()
+        ville = re.sub(r"\bcedex\b.*$", "", ville, flags=re.I).strip()
+        return (m.group(2), ville)
+    return ("","")
+
+def clean_street_numbers(addr: str) -> str:
+    """
+    Si un numéro à 3-4 chiffres est au début et qu'un code postal FR à 5 chiffres apparaît plus loin,
+    on supprime le premier pour éviter la confusion (ex: '1070 Route de...' => 'Route de...').
+    """
+    if not isinstance(addr, str):
+        return addr
+    addr = addr.strip()
+    # Si code postal à 5 chiffres quelque part, supprimer le nombre initial à 3–4 chiffres
+    if re.search(r"\b\d{5}\b", addr):
+        addr = re.sub(r"^\s*\d{3,4}\b\s*", "", addr)
+    return addr
+
+
+def clean_internal_codes(addr: str) -> str:
+    """Nettoie BP, CS et espaces inutiles."""
+    if not isinstance(addr, str):
+        return addr
+    addr = re.sub(r"\b(CS|BP)\s*\d{3,6}\b", "", addr, flags=re.IGNORECASE)
+    addr = re.sub(r"[-]{2,}", "-", addr)
+    addr = re.sub(r"\s{2,}", " ", addr).strip(" ,.-")
+    return addr
+
+_NOTICES = threading.local()
+
+
+@contextmanager
+def collect_notices():
+    """
+    Dans ce bloc, les messages destinés à l'utilisateur (notify) sont ajoutés à
+    la liste renvoyée au lieu d'être affichés : une tâche d'arrière-plan n'a pas
+    de page Streamlit, l'app les affiche quand la tâche est terminée.
+    """
+    _NOTICES.items = []
+    try:
+        yield _NOTICES.items
+    finally:
+        _NOTICES.items = None
+
+
+def notify(text: str, level: str = "info"):
+    """Message utilisateur ("info" ou "warning") : affiché, ou collecté (cf. collect_notices)."""
+    items = getattr(_NOTICES, "items", None)
+    if items is not None:
+        items.append({"level": level, "text": text})
+    elif level == "warning":
+        st.warning(text)
+    else:
+        st.info(text)
+
+
+def _session_id():
+    """Identifiant de la session Streamlit courante (ou du thread hors Streamlit)."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            return ctx.session_id
+    except Exception:
+        pass
+    return threading.current_thread().name
+
+
+_REQUESTS = threading.local()   # requêtes Nominatim réellement envoyées par ce thread
+
+
+def _nominatim_requests() -> int:
+    return getattr(_REQUESTS, "n", 0)
+
+
+def _nominatim_throttle():
+    """Appelé juste avant chaque requête Nominatim (jamais pour une réponse du cache)."""
+    _REQUESTS.n = _nominatim_requests() + 1
+    NOMINATIM_LIMITER.acquire(_session_id())
+
+@st.cache_data(show_spinner=False)
+def geocode(query: str):
+    """Géocode mis en cache ; les appels identiques concurrents (toutes sessions) partagent une requête."""
+    return FLIGHTS.do(("geocode", query), lambda: _geocode(query))
+
+def place_of(lat, lon, addr=None, country="", cp=""):
+    """
+    (pays, code postal) d'un point. Le code pays Nominatim fait foi quand il est
+    présent ; pour les sources qui n'en ont pas (cache, gazetier, site fixe), le
+    pays vient de l'index inverse hors ligne. Le code postal Nominatim est gardé
+    s'il existe, sinon celui du code postal le plus proche (du même pays).
+    """
+    addr = addr or {}
+    index = get_reverse_index()
+    hit = index.lookup(lat, lon) if index is not None else None
+    if addr.get("country_code"):
+        country_res = country_name(addr["country_code"], addr.get("country") or country)
+        near_cp = hit[1] if hit and hit[0] == country_res else ""
+    elif hit:
+        country_res, near_cp = hit[0], hit[1]
+    else:
+        country_res = addr.get("country") or country
+        near_cp = ""
+    return country_res or country, addr.get("postcode") or cp or near_cp
+
+
+def complete_place(lat, lon, country="", cp=""):
+    """
+    Pays / CP d'un résultat déjà géocodé. Le pays donné par la source (code pays
+    Nominatim, API Adresse, gazetier) fait foi ; l'index inverse ne sert qu'à
+    combler un pays absent, ou un CP absent dans le même pays.
+    """
+    if not country:
+        return place_of(lat, lon, None, "", cp)
+    if cp:
+        return country, cp
+    index = get_reverse_index()
+    hit = index.lookup(lat, lon) if index is not None else None
+    return country, hit[1] if hit and hit[0] == country else ""
+
+
+# Géocodeur unitaire : identité unifiée (évite le blocage), budget partagé entre sessions
+NOMINATIM = NominatimGeocoder(
+    MY_USER_AGENT, domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME,
+    throttle=_nominatim_throttle, place=place_of,
+)
+
+
+FOREIGN_STREET_WORDS = {
+    "Italy": r"\b(via|viale|piazza|piazzale|corso|strada)\b",
+    "Spain": r"\b(calle|carretera|avenida|pol[ií]gono|plaza|paseo)\b",
+    "Germany": r"(stra(ss|ß)e|\bstr\.|\bgmbh\b|deutschland|allemagne)",
+}
+
+
+def _country_hint(q_low: str) -> str:
+    """Pays probable d'une adresse (texte en minuscules) : codes postaux, villes et mots caractéristiques."""
+    if re.search(r"\b\d{4}[a-z]{2}\b", q_low) or any(v in q_low for v in ["amsterdam", "rotterdam", "utrecht", "eindhoven", "groningen"]):
+        return "Netherlands"
+    if (re.match(r"^b\d{4}$", q_low) or (re.fullmatch(r"\d{4}", q_low) and 1000 <= int(q_low) <= 9999) or any(v in q_low for v in ["belg", "aarschot", "alken", "ittre", "maasmechelen", "sambreville"])):
+        return "Belgium"
+    if re.match(r"l-\d{4,5}", q_low) or "luxem" in q_low:
+        return "Luxembourg"
+    if ("vila-real" in q_low or "vilareal" in q_low or "castell" in q_low or "espa" in q_low or "barcelone" in q_low or "barcelona" in q_low or q_low.startswith("es-") or "12540" in q_low):
+        return "Spain"
+    if "ital" in q_low or q_low.startswith("it-") or any(v in q_low for v in ["brescia", "bedizzole", "milano", "roma", "verona"]):
+        return "Italy"
+    if "suisse" in q_low or "switzerland" in q_low or "ch-" in q_low:
+        return "Switzerland"
+    for country, pattern in FOREIGN_STREET_WORDS.items():
+        if re.search(pattern, q_low):
+            return country
+    return "France"
+
+
+def _geocode(query: str):
+    """
+    Géocode robuste v21 :
+    - Identité unifiée pour éviter le blocage Nominatim
+    - Affichage de l'erreur réelle en cas d'échec
+    """
+    if not query or not isinstance(query, str):
+        return None
+
+    # Nettoyage de base
+    q = clean_street_numbers(clean_internal_codes(_fix_postcode_spaces(_norm(query))))
+
+    # Sépare les CP collés aux mots : "Hugo76600le" -> "Hugo 76600 le"
+    q = re.sub(r"(\D)(\d{5})", r"\1 \2", q)
+    q = re.sub(r"(\d{5})(\D)", r"\1 \2", q)
+
+    q_low = q.lower().strip()
+
+    # ================= 1) CAS SPECIAL : CP FR SEUL =================
+    if re.fullmatch(r"\d{5}", q_low):
+        return NOMINATIM.geocode(f"{q_low}, France", "France", q_low)
+
+    # ================= 2) DETECTION PAYS =================
+    country_hint = _country_hint(q_low)
+
+    # ================= 3) REQUETE PRINCIPALE =================
+
+    query_full = q if has_explicit_country(q) else f"{q}, {country_hint}"
+
+    # Pays / CP déduits par place_of (code pays Nominatim, index inverse), plus de corrections au cas par cas
+    return NOMINATIM.geocode(query_full, country_hint)
+
+
+   
+
+
+
+OFFLINE_COUNTRIES = {"france": "France", "belgium": "Belgique", "belgique": "Belgique", "belgie": "Belgique",
+                     "belgië": "Belgique", "luxembourg": "Luxembourg"}
+
+def _is_locality_only(s: str, cp: str, ville: str) -> bool:
+    """Vrai si l'adresse se réduit à un CP et/ou une commune (pas de rue)."""
+    rest = s.lower()
+    for token in [cp, ville] + sorted(COUNTRY_WORDS, key=len, reverse=True):
+        if token:
+            rest = rest.replace(token.lower(), " ")
+    return not re.search(r"[a-z0-9à-ÿ]", rest)
+
+def resolve_commune_offline(ville: str, cp: str = "", country_hint: str = "France"):
+    """
+    Résout une commune FR/BE/LU via le gazetier local (trigrammes).
+    Renvoie (lat, lon, pays, cp) si la confiance atteint COMMUNE_CONFIDENCE, sinon None.
+    """
+    resolver = get_resolver()
+    country = OFFLINE_COUNTRIES.get((country_hint or "").lower())
+    if resolver is None or not country or not (ville or cp):
+        return None
+    r = resolver.resolve(ville, cp, countries={country})
+    if not r or r[4] < COMMUNE_CONFIDENCE:
+        return None
+    lat, lon, country_res, cp_res, _ = r
+    return (lat, lon, country_res, cp_res)
+
+@st.cache_data(show_spinner=False)
+def geocode_structured(street: str, cp: str, ville: str, country: str):
+    """
+    Requête Nominatim structurée (street/postalcode/city/country) : pas
+    d'ambiguïté d'analyse du texte libre. Même format de retour que geocode().
+    """
+    return FLIGHTS.do(("structured", street, cp, ville, country),
+                      lambda: _geocode_structured(street, cp, ville, country))
+
+def _geocode_structured(street, cp, ville, country):
+    fields = {"street": street, "postalcode": cp, "city": ville, "country": country}
+    fields = {k: v for k, v in fields.items() if v}
+    if not (fields.get("postalcode") or fields.get("city")):
+        return None
+    return NOMINATIM.geocode(fields, country, cp)
+
+def _country_in(s: str, default: str) -> str:
+    s_low = s.lower()
+    for w in sorted(COUNTRY_WORDS, key=len, reverse=True):
+        if w in s_low:
+            return w
+    return default
+
+BULK_CACHE_SIZE = 100_000      # adresses résolues en masse gardées en mémoire (LRU, toutes sessions)
+PREFETCH_CHUNK = 1000          # adresses par lot en masse quand un délai est imposé
+_BULK_LOCK = threading.Lock()
+_BULK_HITS = OrderedDict()     # adresse nettoyée -> (lat, lon, pays, cp) résolue en masse
+
+
+def _clean_query(raw_addr: str) -> str:
+    return clean_street_numbers(clean_internal_codes(_fix_postcode_spaces(_norm(raw_addr))))
+
+
+def _is_french_street_address(s: str) -> bool:
+    """
+    CP à 5 chiffres et aucun indice d'adresse étrangère (pays cité, ville, mot de
+    voie, cf. _country_hint) : candidate à l'API Adresse, qui ne connaît que la France.
+    """
+    return (bool(re.search(r"\b\d{5}\b", s)) and _country_in(s, "france") == "france"
+            and _country_hint(s.lower()) == "France")
+
+
+def _bulk_hit(s: str):
+    with _BULK_LOCK:
+        g = _BULK_HITS.get(s)
+        if g is not None:
+            _BULK_HITS.move_to_end(s)
+        return g
+
+
+def prefetch_geocodes(addresses, geocoder=None, deadline=None):
+    """
+    Géocode d'un coup les adresses françaises de la liste (API Adresse, CSV) ;
+    try_geocode_with_fallbacks les sert ensuite sans requête unitaire. Les
+    adresses étrangères ou non résolues suivent la chaîne habituelle.
+    deadline (time.monotonic) : plus aucun lot n'est envoyé une fois dépassée.
+    Renvoie le nombre d'adresses résolues.
+    """
+    geocoder = geocoder or BULK_GEOCODER
+    if geocoder is None:
+        return 0
+    with _BULK_LOCK:
+        todo = sorted({q for q in map(_clean_query, addresses)
+                       if q and q not in _BULK_HITS and _is_french_street_address(q)})
+    if not todo:
+        return 0
+    t0 = time.perf_counter()
+    found = 0
+    # lots plus petits sous délai : on peut s'arrêter entre deux envois
+    step = PREFETCH_CHUNK if deadline is not None else len(todo)
+    for start in range(0, len(todo), step):
+        if deadline is not None and time.monotonic() >= deadline:
+            print(f"⏱️ Géocodage en masse interrompu par le délai ({start}/{len(todo)} adresses envoyées)")
+            break
+        part = todo[start:start + step]
+        results = geocoder.geocode_many(part)
+        with _BULK_LOCK:
+            for q, g in zip(part, results):
+                if g:
+                    lat, lon, country, cp = g
+                    country, cp = complete_place(lat, lon, country, cp)
+                    _BULK_HITS[q] = (lat, lon, country, cp)
+                    found += 1
+            while len(_BULK_HITS) > BULK_CACHE_SIZE:
+                _BULK_HITS.popitem(last=False)
+    print(f"ℹ️ Géocodage en masse ({geocoder.name}) : {found}/{len(todo)} adresses en {time.perf_counter() - t0:.1f} s")
+    return found
+
+
+def try_geocode_with_fallbacks(raw_addr: str, assumed_country_hint: str = "France"):
+    """
+    Essaye plusieurs variantes d'une même adresse pour fiabiliser le géocodage.
+    Les variantes réseau sont rangées en paliers (adresse, puis commune, puis
+    brut) ; dans chaque palier, l'ordre suit les taux de succès observés pour
+    cette forme d'adresse (geocode_ladder) et les variantes qui n'aboutissent
+    jamais sont sautées.
+    """
+    s = _clean_query(raw_addr)
+    explicit_overseas = has_explicit_country(s)
+    cp, ville = extract_cp_city(s)
+    # pays cité dans l'adresse, sinon le pays supposé
+    country = _country_in(s, assumed_country_hint) if explicit_overseas else assumed_country_hint
+
+    # Commune seule (ou CP seul) : le gazetier local suffit, pas de requête réseau
+    if country.lower() in OFFLINE_COUNTRIES:
+        town = ville
+        bare = re.sub(r"\b(" + "|".join(map(re.escape, COUNTRY_WORDS)) + r")\b", "", s, flags=re.I).strip(" ,")
+        bare_cp = re.fullmatch(r"(?:[BL]-?)?(\d{4,5})", bare, flags=re.I)
+        if bare_cp:
+            cp, town = bare_cp.group(1), ""    # CP seul : "75011", "B-1460", "1460 Belgique"
+        elif not (cp or ville) and not re.search(r"\d", s):
+            town = bare
+        if bare_cp or _is_locality_only(s, cp, town):
+            g = resolve_commune_offline(town, cp, country)
+            if g:
+                return g
+
+    # Déjà résolue par le géocodage en masse (prefetch_geocodes)
+    g = _bulk_hit(s)
+    if g:
+        return g
+
+    suffix = "" if explicit_overseas else ", France"
+    street = split_street(s, cp)
+    variants = {
+        # palier 1 : adresse complète
+        "structuré": lambda: geocode_structured(street, cp, ville, country) if street and (cp or ville) else None,
+        "complet": lambda: geocode(s if explicit_overseas else f"{s}, {assumed_country_hint}"),
+        # palier 2 : commune
+        "structuré commune": lambda: geocode_structured("", cp, ville, country) if (cp or ville) else None,
+        "ville": lambda: geocode(ville + suffix) if ville else None,
+        "cp": lambda: geocode(cp + suffix) if cp else None,
+        # palier 3 : texte brut
+        "brut": lambda: geocode(s),
+    }
+    tiers = [["structuré", "complet"], ["structuré commune", "ville", "cp"], ["brut"]]
+    if not street:
+        tiers[0].remove("structuré")
+    if not (cp or ville):
+        tiers[1] = []
+
+    stats = get_ladder_stats(LADDER_STATS_PATH)
+    shape = address_shape(street, cp, ville, explicit_overseas)
+    stats.record_address()
+    for i, tier in enumerate(tiers):
+        if i == 1 and tier:
+            # les variantes commune sont d'abord tentées hors ligne
+            g = resolve_commune_offline(ville, cp, country)
+            if g:
+                return g
+        for name in stats.order(shape, tier):
+            sent = _nominatim_requests()
+            g = variants[name]()
+            # réponse du cache (ou d'une requête identique en cours) : ni essai ni succès
+            if _nominatim_requests() > sent:
+                stats.record(shape, name, bool(g))
+            if g:
+                return g
+    return None
+
+
+
+
+def _osrm_km(base_coords, coords):
+    """Distance routière OSRM en km, ou None en cas d'échec."""
+    import requests
+    try:
+        # 🚗 Requête vers OSRM (service public)
+        OSRM_LIMITER.acquire(_session_id())
+        url = f"{OSRM_URL}/route/v1/driving/{base_coords[1]},{base_coords[0]};{coords[1]},{coords[0]}?overview=false"
+        r = requests.get(url, timeout=15)
+        if r.status_code == 200:
+            js = r.json()
+            return js["routes"][0]["distance"] / 1000.0
+        else:
+            print(f"⚠️ OSRM renvoie un code {r.status_code}")
+    except Exception as e:
+        print(f"⚠️ OSRM échouée : {e}")
+    return None
+
+def distance_km(base_coords, coords, region="", estimator=None, cutoff_km=None, local_graph=True):
+    """
+    Calcule la distance entre deux points :
+    0️⃣ Graphe routier local s'il est installé (hors ligne, distance exacte)
+    0️⃣ Si un estimateur calibré est fourni et que son estimation n'est pas
+       ambiguë (intervalle étroit, ou loin de la distance seuil `cutoff_km`) :
+       estimation instantanée, sans appel réseau
+    1️⃣ Priorité : distance routière via OSRM (gratuite et sans clé)
+    2️⃣ Fallback : distance géodésique (vol d’oiseau)
+    local_graph=False : le graphe a déjà été interrogé (par lot) sans réponse.
+    Retourne un tuple : (distance_km arrondie, type_utilisé)
+    """
+    if not coords or not base_coords:
+        return None, ""
+
+    from geopy.distance import geodesic
+
+    geo = geodesic(base_coords, coords).km
+    d = ROAD_GRAPH.route_km(base_coords, coords) if ROAD_GRAPH is not None and local_graph else None
+    if d is not None:
+        if estimator is not None:
+            estimator.learn(geo, d, region)
+        return round(d, 1), "Graphe routier local"
+    if estimator is not None:
+        e = estimator.estimate(geo, region)
+        if e and not estimator.is_ambiguous(e[0], e[1], e[2], cutoff_km):
+            return round(e[0], 1), ESTIMATE_TYPE
+
+    key = ("osrm", round(base_coords[0], 5), round(base_coords[1], 5), round(coords[0], 5), round(coords[1], 5))
+    d = FLIGHTS.do(key, lambda: _osrm_km(base_coords, coords))
+    if d is not None:
+        if estimator is not None:
+            estimator.learn(geo, d, region)
+        return round(d, 1), "API OSRM"
+
+    # 🕊️ Fallback vol d’oiseau
+    d = geo
+    return round(d, 1), "Vol d’oiseau"
+
+
+def offline_distances(base_coords, sites, estimator=None):
+    """
+    Distances sans appel réseau vers chaque (coords, région) de sites : graphe
+    routier local (une seule recherche pour tout le lot), estimation calibrée,
+    sinon vol d'oiseau. Renvoie une liste de (distance, type).
+    """
+    if not sites:
+        return []
+    road = (ROAD_GRAPH.distances_km(base_coords, [coords for coords, _ in sites])
+            if ROAD_GRAPH is not None else [None] * len(sites))
+    out = []
+    for (coords, region), d in zip(sites, road):
+        if d is not None:
+            out.append((round(d, 1), "Graphe routier local"))
+            continue
+        geo = geodesic(base_coords, coords).km
+        e = estimator.estimate(geo, region) if estimator is not None else None
+        out.append((round(e[0], 1), ESTIMATE_TYPE) if e else (round(geo, 1), "Vol d’oiseau"))
+    return out
+
+
+def geodesic_km_many(base_coords, lats, lons):
+    """
+    Vol d'oiseau (haversine, km) du projet vers tous les points d'un coup.
+    Écart < 0,5 % avec geopy.geodesic, suffisant pour trier et filtrer.
+    """
+    R = 6371.0088
+    lat1, lon1 = np.radians(base_coords[0]), np.radians(base_coords[1])
+    lat2 = np.radians(np.asarray(lats, dtype="float64"))
+    lon2 = np.radians(np.asarray(lons, dtype="float64"))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * R * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def routing_budget(geo_km, max_routes=None, radius_km=None):
+    """
+    Masque des points à router : les `max_routes` plus proches et/ou ceux à moins
+    de `radius_km` (les deux critères se cumulent). NaN (non géocodés) : jamais.
+    """
+    geo_km = np.asarray(geo_km, dtype="float64")
+    mask = ~np.isnan(geo_km)
+    if radius_km:
+        mask &= geo_km <= radius_km
+    if max_routes:
+        order = np.argsort(np.where(mask, geo_km, np.inf), kind="stable")
+        top = np.zeros(len(geo_km), dtype=bool)
+        top[order[:max_routes]] = True
+        mask &= top
+    return mask
+
+
+
+
+
+# ================= COLONNES & CONTACT MOA (v12-style+) ======
+def _find_columns(cols):
+    """
+    Détection robuste des colonnes :
+    - champs clés (raison/catégorie/référent/email_referent/adresse)
+    - groupes de colonnes contacts (tech/dir/comce/com)
+    - colonnes 'contacts' génériques
+    """
+    res = {
+        "tech_cols": [], "dir_cols": [], "comce_cols": [], "com_cols": [], "contact_cols": []
+    }
+    for c in cols:
+        cl = c.lower().strip()
+
+        # clés fixes
+        if "raison" in cl and "sociale" in cl: res["raison"] = c
+        elif "catég" in cl or "categorie" in cl: res["categorie"] = c
+        elif ("référent" in cl and "moa" in cl) or ("referent" in cl and "moa" in cl): res["referent"] = c
+        elif ("email" in cl and "referent" in cl) or ("email" in cl and "référent" in cl): res["email_referent"] = c
+        elif "adress" in cl: res["adresse"] = c
+
+        # contacts : large
+        # on classe par priorité via mots-clés
+        if "tech" in cl:
+            res["tech_cols"].append(c)
+        if "dir" in cl or "dirige" in cl:
+            res["dir_cols"].append(c)
+        if "comce" in cl:  # si tu as cet acronyme précis
+            res["comce_cols"].append(c)
+        # "com" peut être ambigu (company). On limite aux variantes usuelles:
+        if re.search(r"\bcom\b|\bcommercial", cl):
+            res["com_cols"].append(c)
+        # colonnes génériques "contact" (si pas déjà rangées)
+        if "contact" in cl and c not in (res["tech_cols"] + res["dir_cols"] + res["comce_cols"] + res["com_cols"]):
+            res["contact_cols"].append(c)
+
+        # colonne simple "contacts"
+        if "contacts" == cl or cl.startswith("contacts "):
+            res["contacts"] = c
+
+    return res
+
+def _first_email_in_text(text:str)->str|None:
+    if not isinstance(text,str): return None
+    m = EMAIL_RE.search(text)
+    return m.group(0) if m else None
+
+def _email_local(e:str)->str:
+    return e.split("@",1)[0].lower() if isinstance(e,str) else ""
+
+def _tokens(name:str)->list[str]:
+    if not isinstance(name,str): return []
+    return [t for t in re.split(r"[\s\-]+", name.lower()) if len(t)>=2]
+
+def _emails_from_columns(row, cols):
+    for col in cols:
+        val = str(row.get(col, "")).strip()
+        if not val: 
+            continue
+        em = _first_email_in_text(val) or (val if "@" in val else None)
+        if em:
+            return em
+    return None
+
+def choose_contact_moa(row, colmap):
+    """
+    Priorité:
+      1) email_referent direct
+      2) matching nom référent sur groupes Tech/Dir/Comce/Com (v12-style: colonnes nommées librement)
+      3) fallback premier dispo Tech -> Dir -> Comce -> Com -> Contacts génériques (y compris "Contacts")
+    """
+    # 1) email référent explicite
+    if colmap.get("email_referent"):
+        v = row.get(colmap["email_referent"], "")
+        if isinstance(v,str) and "@" in v:
+            return v.strip()
+
+    # groupes détectés
+    tech = colmap.get("tech_cols", [])
+    diro = colmap.get("dir_cols", [])
+    comce = colmap.get("comce_cols", [])
+    com = colmap.get("com_cols", [])
+    generic = colmap.get("contact_cols", [])
+    contacts_simple = [colmap.get("contacts")] if colmap.get("contacts") else []
+
+    # 2) matching par nom du référent (si fourni)
+    referent = str(row.get(colmap.get("referent",""), "")).strip() if colmap.get("referent") else ""
+    toks = _tokens(referent)
+
+    if toks:
+        # on rassemble les candidats (ordre de priorité)
+        scan_groups = [tech, diro, comce, com, generic, contacts_simple]
+        for group in scan_groups:
+            # on cherche l'email dont la partie locale match le plus de tokens
+            best_email, best_score = None, -1
+            for col in group:
+                val = str(row.get(col, "")).strip()
+                em = _first_email_in_text(val) or (val if "@" in val else None)
+                if not em: 
+                    continue
+                local = _email_local(em)
+                score = sum(t in local for t in toks)
+                if score > best_score:
+                    best_score, best_email = score, em
+            if best_email and best_score > 0:
+                return best_email
+
+    # 3) fallback: premier email dispo selon l'ordre Tech -> Dir -> Comce -> Com -> Contacts génériques -> "Contacts"
+    for group in [tech, diro, comce, com, generic, contacts_simple]:
+        em = _emails_from_columns(row, group)
+        if em:
+            return em
+
+    return ""
+ 
+def _is_site_column(c) -> bool:
+    cl = str(c).lower()
+    return ("implant" in cl and "indus" in cl) or ("siège" in cl) or ("siege" in cl)
+
+def _is_needed_column(c) -> bool:
+    """Colonne utile au pipeline (détectée par _find_columns, adresse, implantations, siège)."""
+    cl = str(c).lower()
+    if _is_site_column(c) or "implant" in cl or cl == "adresse":
+        return True
+    found = _find_columns([c])
+    return any(v for v in found.values())
+
+def _sniff_separator(csv_bytes):
+    """Devine le séparateur sur l'en-tête (pour lire ensuite avec le moteur C) ; None si inconnu."""
+    try:
+        if hasattr(csv_bytes, "read"):
+            head = csv_bytes.read(64 * 1024)
+            csv_bytes.seek(0)
+        else:
+            with open(csv_bytes, "rb") as f:
+                head = f.read(64 * 1024)
+        if isinstance(head, bytes):
+            head = head.decode("utf-8", errors="ignore")
+        return csv.Sniffer().sniff(head.splitlines()[0], delimiters=";,\t|").delimiter
+    except Exception:
+        return None
+
+def _contact_columns(colmap) -> list:
+    """Colonnes lues par choose_contact_moa."""
+    cols = []
+    for v in colmap.values():
+        for c in (v if isinstance(v, list) else [v]):
+            if c and c not in cols:
+                cols.append(c)
+    return cols
+
+def _text(series):
+    """Colonne texte Arrow, valeurs manquantes -> "" (et non plus la chaîne "nan")."""
+    return series.astype(TEXT_DTYPE).fillna("")
+
+def _text_column(df, col):
+    if col:
+        return _text(df[col])
+    return pd.Series("", index=df.index, dtype=TEXT_DTYPE)
+
+def typed_result_frame(columns: dict) -> pd.DataFrame:
+    """Assemble le résultat colonne par colonne avec les types compacts."""
+    out = pd.DataFrame(index=pd.RangeIndex(len(next(iter(columns.values()), []))))
+    for c, values in columns.items():
+        if c in NUMERIC_COLUMNS:
+            out[c] = pd.to_numeric(pd.Series(values, dtype="object"), errors="coerce").astype("float64")
+        elif c in CATEGORICAL_COLUMNS:
+            out[c] = pd.Categorical(["" if v is None else str(v) for v in values])
+        else:
+            out[c] = pd.array(["" if v is None else str(v) for v in values], dtype=TEXT_DTYPE)
+    return out
+
+def process_csv_to_df(csv_bytes):
+    """
+    Lit le CSV et construit le DataFrame de base :
+    - ne charge que les colonnes utiles (raison, catégorie, adresse, référent, contacts, sites)
+    - conserve les colonnes essentielles (raison, catégorie, adresse, référent)
+    - calcule le Contact MOA selon la logique élargie (v12-style)
+    - garde les colonnes d'implantations industrielles et du siège pour la sélection des sites
+    - crée toujours une colonne 'Adresse' même si elle n’existe pas dans le CSV
+    Texte en chaînes Arrow, Catégories en catégoriel.
+    """
+    sep = _sniff_separator(csv_bytes)
+    try:
+        df = pd.read_csv(csv_bytes, sep=sep, engine="c" if sep else "python", dtype=TEXT_DTYPE, usecols=_is_needed_column)
+    except Exception:
+        if hasattr(csv_bytes, "seek"):
+            csv_bytes.seek(0)
+        df = pd.read_csv(csv_bytes, sep=";", engine="python", dtype=TEXT_DTYPE, usecols=_is_needed_column)
+
+    # Détection des colonnes importantes
+    colmap = _find_columns(df.columns)
+
+    out = pd.DataFrame(index=df.index)
+
+    # --- Colonnes principales ---
+    out["Raison sociale"] = _text_column(df, colmap.get("raison"))
+    out["Référent MOA"] = _text_column(df, colmap.get("referent"))
+    out["Catégories"] = _text_column(df, colmap.get("categorie")).astype("category")
+
+    # --- Adresse principale : crée toujours la colonne ---
+    if colmap.get("adresse"):
+        out["Adresse"] = _text(df[colmap["adresse"]])
+    elif "Adresse" in df.columns:
+        out["Adresse"] = _text(df["Adresse"])
+    elif "Adresse-du-siège" in df.columns:
+        out["Adresse"] = _text(df["Adresse-du-siège"])
+    elif "adresse-du-siège" in df.columns:
+        out["Adresse"] = _text(df["adresse-du-siège"])
+    else:
+        # dernier recours : première adresse industrielle trouvée
+        possible_cols = [c for c in df.columns if "implant" in c.lower()]
+        if possible_cols:
+            out["Adresse"] = _text(df[possible_cols[0]])
+        else:
+            out["Adresse"] = _text_column(df, None)
+
+    # --- Contact MOA (calcul automatique, sans construire une Series par ligne) ---
+    cols = _contact_columns(colmap)
+    records = (dict(zip(cols, vals)) for vals in zip(*(_text(df[c]).tolist() for c in cols))) if cols else ({} for _ in df.index)
+    out["Contact MOA"] = pd.array([choose_contact_moa(r, colmap) for r in records], dtype=TEXT_DTYPE)
+
+    # --- Colonnes supplémentaires : implantations industrielles et siège ---
+    for c in df.columns:
+        if _is_site_column(c):
+            out[c] = _text(df[c])
+
+    return out
+
+# ================ SITES (implantations / siège) =============
+# ---------------------------------------------------------------------
+# VALIDATION ADRESSES
+# ---------------------------------------------------------------------
+def _is_valid_site_address(a):
+    if not isinstance(a, str):
+        return False
+    a = a.strip()
+    if a in ["", "nan"]:
+        return False
+    if re.fullmatch(r"\d{5}\.0", a):
+        return False
+    if re.fullmatch(r"\d{5}", a):  # CP FR seul
+        return False
+    if re.fullmatch(r"\d{4}[A-Za-z]{2}", a):  # NL
+        return False
+    if re.fullmatch(r"[Bb]\d{4}", a):  # BE Bxxxx
+        return False
+    if re.fullmatch(r"[Ll]-\d{4,5}", a):  # LU
+        return False
+    if re.fullmatch(r"\d+", a):  # nombre seul
+        return False
+    return True
+
+# ---------------------------------------------------------------------
+# NORMALISATION
+# ---------------------------------------------------------------------
+def _normalize_site(a):
+    a = str(a or "")
+    a = re.sub(r"multi[-\s]*sites?", "", a, flags=re.I)
+    a = re.sub(r"\(.*?\)", "", a)
+    a = re.sub(r"\s{2,}", " ", a).strip(" ,")
+    if "chessy" in a.lower() and "69380" in a and "rhône" not in a.lower():
+        a = "69380 Chessy, Rhône, France"
+    return a
+
+# ---------------------------------------------------------------------
+# MULTI-SITE
+# ---------------------------------------------------------------------
+def _split_multisite(a):
+    parts = re.split(r"[;\n/]", str(a or ""))
+    return [p.strip(" ,") for p in parts if _is_valid_site_address(p.strip())]
+
+
+def site_candidates(addr_field: str, row) -> list:
+    """Toutes les adresses qu'examinera pick_site_with_indus_priority (pour le géocodage en masse)."""
+    out = []
+    for c in row.index:
+        cl = c.lower()
+        if ("implant" in cl and "indus" in cl) or "siège" in cl or "siege" in cl:
+            out += [_normalize_site(a) for a in _split_multisite(row[c])]
+    out.append(_normalize_site(addr_field))
+    return out
+
+
+def approximate_site(addr_field: str, row):
+    """
+    Site approché sans réseau, dans l'ordre de priorité des sites : adresse déjà
+    résolue par le géocodage en masse, sinon centre de la commune (gazetier).
+    Renvoie (adresse, (lat, lon), pays, cp, fiabilité) ou None.
+    """
+    cands = site_candidates(addr_field, row)
+    for a in cands:
+        g = _bulk_hit(_clean_query(a))
+        if g:
+            return a, (g[0], g[1]), g[2], g[3], PRECISION_BULK
+    for a in cands:
+        s = _clean_query(a)
+        cp, ville = extract_cp_city(s)
+        g = resolve_commune_offline(ville, cp, _country_in(s, "France"))
+        if g:
+            return a, (g[0], g[1]), g[2], g[3], PRECISION_COMMUNE
+    return None
+
+
+def pick_site_with_indus_priority(addr_field: str, base_coords: tuple[float, float], row=None,
+                                  resolve=None):
+    """
+    Priorité stricte :
+      1) entreprises à adresse fixe (forçages)
+      2) implantations industrielles
+      3) siège
+      4) fallback adresse principale
+    resolve(adresse, pays supposé) : géocodeur des sites (défaut try_geocode_with_fallbacks ;
+    compute_distances y intercale le référentiel fournisseurs).
+    Retour : (adresse, (lat,lon) or None, pays, cp, dist)
+    """
+    resolve = resolve or try_geocode_with_fallbacks
+
+    from geopy.distance import geodesic
+
+    if row is None:
+        return (addr_field or "").strip(), None, "", "", None
+
+    name = str(row.get("Raison sociale", "") or "").lower().strip()
+
+    # ---------------------------------------------------------------------
+    # FIXED SITES
+    # ---------------------------------------------------------------------
+    FIXED_SITES = {
+        "cci france pays-bas": ("16 Hogehilweg, 1101CD Amsterdam, Pays-Bas", "Pays-Bas", "1101CD"),
+        "ecococon": ("Voderady 91942, Slovaquie", "Slovaquie", "91942"),
+        "gramitherm": ("Boulevard de l’Europe 87, 5060 Sambreville, Belgique", "Belgique", "5060"),
+        "litobox": ("Industriezone Kolmen, Stationsstraat 110bus2, B3570 Alken, Belgique", "Belgique", "B3570"),
+        "takki": ("Rue du Halage 13, 1460 Ittre, Belgique", "Belgique", "1460"),
+        "easy’go wood": ("Rue du Halage 13, 1460 Ittre, Belgique", "Belgique", "1460"),
+        "easy'go wood": ("Rue du Halage 13, 1460 Ittre, Belgique", "Belgique", "1460"),
+        "vandersanden": ("Slakweidestraat 41, 3630 Maasmechelen, Belgique", "Belgique", "3630"),
+        "hekipia": ("69380 Chessy, Rhône, France", "France", "69380"),
+        "eurocomponent": ("Via Malignani 10, 33058 San Giorgio di Nogaro, Italie", "Italie", "33058"),
+        "eurocomposant": ("Via Malignani 10, 33058 San Giorgio di Nogaro, Italie", "Italie", "33058"),
+        "retrofitt": ("Nieuwlandlaan 39/B224, 3200 Aarschot, Belgique", "Belgique", "3200"),
+        "porcelanosa": ("Carretera Nacional 340, km 55,8, 12540 Vila-real, Espagne", "Espagne", "12540"),
+        "butech": ("Carretera Nacional 340, km 55,8, 12540 Vila-real, Espagne", "Espagne", "12540"),
+    }
+
+    for k, (forced_addr, forced_country, forced_cp) in FIXED_SITES.items():
+        if k in name:
+            g = resolve(forced_addr, forced_country)
+            if g:
+                lat, lon, _, _ = g
+                dist = geodesic(base_coords, (lat, lon)).km
+                return forced_addr, (lat, lon), forced_country, forced_cp, dist
+            return forced_addr, None, forced_country, forced_cp, None
+
+    # ---------------------------------------------------------------------
+    # GEOCODE
+    # ---------------------------------------------------------------------
+    def _geocode_addr(a):
+        g = resolve(a, "France")
+        if not g:
+            return None
+        lat, lon, country, cp = g
+        # pays de la source conservé ; l'index inverse ne comble que les manques
+        country, cp = complete_place(lat, lon, country, cp)
+        return (a, (lat, lon), country, cp)
+
+    # ---------------------------------------------------------------------
+    # BEST CANDIDATE
+    # ---------------------------------------------------------------------
+    def _best_of(lst):
+        best = None
+        for raw in lst:
+            norm = _normalize_site(raw)
+            g = _geocode_addr(norm)
+            if not g:
+                continue
+            addr2, coords, country, cp = g
+            dist = geodesic(base_coords, coords).km
+            cand = (addr2, coords, country, cp, dist)
+            if best is None or dist < best[-1]:
+                best = cand
+        return best
+
+    # 1) IMPLANTATIONS
+    indus_cols = [c for c in row.index if "implant" in c.lower() and "indus" in c.lower()]
+    indus_list = []
+    for c in indus_cols:
+        indus_list += _split_multisite(row[c])
+    best = _best_of(indus_list)
+    if best:
+        return best
+
+    # 2) SIÈGE
+    siege_cols = [c for c in row.index if "siège" in c.lower() or "siege" in c.lower()]
+    siege_list = []
+    for c in siege_cols:
+        siege_list += _split_multisite(row[c])
+    best = _best_of(siege_list)
+    if best:
+        return best
+
+    # 3) ADRESSE PRINCIPALE
+    norm = _normalize_site(addr_field)
+    g = _geocode_addr(norm)
+    if g:
+        addr2, coords, country, cp = g
+        dist = geodesic(base_coords, coords).km
+        return addr2, coords, country, cp, dist
+
+    return addr_field, None, "", "", None
+
+
+# =================== DISTANCES & FINALE =====================
+def compute_distances(df, base_address, master_path=MASTER_PATH, checkpoint=None, progress=None,
+                      cutoff_km=None, max_routes=None, radius_km=None, deadline_s=None):
+    """
+    Adresse du projet : CP seul, CP+Ville, Ville ou adresse complète.
+    Toujours géocodable via fallback solide.
+    Les adresses de sites déjà géocodées (tous projets confondus) et les trajets
+    déjà routés vers ce lieu de projet sont repris du référentiel `master_path`
+    (Parquet, cf. supplier_master) sans nouvelle requête.
+    checkpoint : journal des lignes déjà calculées (cf. jobs.Checkpoint), pour reprendre un run interrompu.
+    progress(fait, total) : appelé après chaque ligne.
+    cutoff_km : distance seuil de l'utilisateur ; les estimations calibrées qui la
+    chevauchent sont vérifiées par le routeur, les autres sont gardées telles quelles.
+    max_routes / radius_km : budget de routage. Seuls les N fournisseurs les plus
+    proches (vol d'oiseau) et/ou ceux à moins de R km passent par distance_km ;
+    les autres gardent le vol d'oiseau. Le routage se fait alors après le géocodage
+    de tout le fichier.
+    Avec un graphe routier local (ROAD_GRAPH), les distances sont aussi calculées
+    après le géocodage, en un seul lot (une recherche depuis le projet).
+    deadline_s : délai en secondes. Les fournisseurs à calculer sont traités du plus
+    proche au plus lointain (position estimée hors ligne) ; passé le délai, les
+    suivants sont approchés sans réseau (adresse déjà géocodée en masse, centre de
+    la commune) et signalés dans « Fiabilité géocode ». Le délai court dès l'appel
+    (géocodage de la base et géocodage en masse compris) ; avec un checkpoint, dès
+    le premier lancement (checkpoint.started) : une reprise ne le remet pas à zéro.
+    """
+    t_end = None
+    if deadline_s:
+        elapsed = time.time() - checkpoint.started if checkpoint is not None else 0.0
+        t_end = time.monotonic() + deadline_s - elapsed
+
+    if not base_address.strip():
+        notify("⚠️ Aucune adresse de référence fournie.", "warning")
+        return df, None, {}
+
+    q = _fix_postcode_spaces(_norm(base_address))
+    base = None
+
+    # ======================================================
+    # 1) CAS LE PLUS SIMPLE : CP seul → toujours accepté
+    # ======================================================
+    if re.fullmatch(r"\d{5}", q):
+        base = geocode(f"{q}, France")
+        if base:
+            notify(f"📍 Lieu interprété comme : {q}, France")
+
+    # ======================================================
+    # 2) CP + Ville OU Ville seule
+    # ======================================================
+    if not base:
+        base = geocode(q)
+        if base:
+            notify(f"📍 Lieu interprété comme : {q}")
+
+    # ======================================================
+    # 3) Fallback automatique CP/Ville
+    # ======================================================
+    if not base:
+        cp, ville = extract_cp_city(q)
+
+        if cp and ville:
+            base = geocode(f"{cp} {ville}, France")
+        elif cp:
+            base = geocode(f"{cp}, France")
+        elif ville:
+            base = geocode(f"{ville}, France")
+
+        if base:
+            notify(f"ℹ️ Lieu interprété comme fallback : {cp or ''} {ville or ''}".strip())
+
+    # ======================================================
+    # 4) ERREUR SI RIEN
+    # ======================================================
+    if not base:
+        notify(f"⚠️ Lieu de référence non géocodable : '{base_address}'.", "warning")
+        n = len(df)
+        return typed_result_frame({
+            "Raison sociale": df["Raison sociale"].tolist(),
+            "Pays": [""] * n,
+            "Adresse": df["Adresse"].tolist(),
+            "Code postal": [extract_cp_fallback(a) for a in df["Adresse"].tolist()],
+            "Distance au projet": [None] * n,
+            "Catégories": df["Catégories"].tolist(),
+            "Référent MOA": df["Référent MOA"].tolist(),
+            "Contact MOA": df["Contact MOA"].tolist(),
+            "Type de distance": [""] * n,
+            "Fiabilité géocode": [""] * n,
+            "Latitude": [None] * n,
+            "Longitude": [None] * n,
+        }), None, {}
+
+    # ======================================================
+    # 5) BASE OK → lancement distances
+    # ======================================================
+    base_coords = (base[0], base[1])
+    chosen_coords = {}
+
+    master = sm.load_master(master_path)
+    known_routes = sm.load_distances(master_path)
+    estimator = get_estimator(ROAD_CALIBRATION_PATH)
+    site_cols = sm.site_columns(df.columns)
+    new_geocodes, new_routes, hashes = [], [], []
+    n_hits = 0
+    n_known = 0
+
+    def resolve(addr, hint):
+        """Géocodage d'un site : référentiel d'abord, sinon la chaîne habituelle (résultat mémorisé)."""
+        nonlocal n_known
+        g = sm.lookup(master, addr)
+        if g:
+            n_known += 1
+            return g
+        g = try_geocode_with_fallbacks(addr, hint)
+        if g:
+            new_geocodes.append(sm.make_geocode(addr, *g))
+        return g
+
+    def remember(coords, dist, dist_type):
+        """Seules les distances routières sont gardées (vol d'oiseau et estimations sont refaits)."""
+        if coords and dist is not None and dist_type in ROAD_TYPES:
+            new_routes.append(sm.make_distance(coords, base_coords, dist, dist_type))
+
+    budget = bool(max_routes or radius_km)
+    local = ROAD_GRAPH is not None     # graphe local : distances calculées par lot, en une recherche
+    deferred = []       # lignes géocodées dont la distance attend le budget de routage ou le lot
+
+    n_rows = len(df)
+    rows = list(df.iterrows())
+    # Regroupement : les lignes d'un même fournisseur (clé normalisée + mêmes sites,
+    # ex. une ligne par catégorie ou par contact) ne sont calculées qu'une fois
+    members = {}        # hash -> positions des lignes du groupe (la première le calcule)
+    hits = []
+    for pos, (_, row) in enumerate(rows):
+        name = str(row.get("Raison sociale", "")).strip()
+        h = sm.row_hash(name, sm.normalized_addresses(row, site_cols))
+        hashes.append(h)
+        group = members.setdefault(h, [])
+        group.append(pos)
+        lead = len(group) == 1
+        hits.append(checkpoint.get(pos) if checkpoint is not None and lead else None)
+    leaders = {h: group[0] for h, group in members.items()}
+
+    # Adresses des fournisseurs à calculer, hors référentiel : les françaises partent d'un bloc à l'API Adresse
+    prefetch_geocodes((a for pos, (_, row) in enumerate(rows)
+                       if leaders[hashes[pos]] == pos and not hits[pos]
+                       for a in site_candidates(str(row.get("Adresse", "")), row)
+                       if sm.lookup(master, a) is None),
+                      deadline=t_end)
+
+    # Délai : les fournisseurs à calculer passent du plus proche (estimation hors
+    # ligne) au plus lointain ; une fois le délai écoulé, le reste est approché.
+    order = [pos for h, pos in leaders.items()]
+    approx = {}
+    if t_end is not None:
+        for pos in order:
+            if not hits[pos]:
+                _, row = rows[pos]
+                approx[pos] = approximate_site(str(row.get("Adresse", "")), row)
+        def _priority(pos):
+            if hits[pos]:
+                return (0, 0.0)                         # déjà connu : gratuit
+            a = approx[pos]
+            return (1, geodesic(base_coords, a[1]).km) if a else (2, 0.0)
+        order.sort(key=_priority)
+
+    result = {c: [None] * n_rows for c in RESULT_COLUMNS}
+    done = 0
+    n_degraded = 0
+    offline = []        # (fournisseur, (coords, région)) à mesurer hors ligne, en un lot (délai écoulé)
+    for pos in order:
+        _, row = rows[pos]
+        adresse = str(row.get("Adresse", ""))
+        h = hashes[pos]
+        precision = "indus"
+
+        hit = hits[pos]
+        if hit:
+            n_hits += 1
+            kept_addr, coords, country, cp, dist, dist_type = hit
+            # un vol d'oiseau (hors budget d'un run précédent, échec OSRM) ou une estimation
+            # mémorisés ne sont pas définitifs : ils repassent par le budget courant, ou par
+            # distance_km s'il n'y en a pas (l'estimation n'est gardée que si elle reste
+            # non ambiguë pour le seuil du run)
+            if coords and dist_type not in ROAD_TYPES:
+                if budget or local:
+                    deferred.append((pos, h, kept_addr, coords, country, cp))
+                elif t_end is None or time.monotonic() < t_end:
+                    dist, dist_type = distance_km(base_coords, coords, region_of(country, cp), estimator, cutoff_km)
+                    remember(coords, dist, dist_type)
+                    if checkpoint is not None:
+                        checkpoint.add(pos, kept_addr, coords, country, cp, dist, dist_type)
+        elif t_end is not None and time.monotonic() >= t_end:
+            # délai écoulé : site approché hors ligne, distance sans appel réseau, rien n'est mémorisé
+            n_degraded += 1
+            a = approx.get(pos)
+            if a:
+                kept_addr, coords, country, cp, precision = a
+                dist, dist_type = None, ""
+                offline.append((h, (coords, region_of(country, cp))))
+            else:
+                kept_addr, coords, country, cp = adresse, None, "", extract_cp_fallback(adresse)
+                dist, dist_type, precision = None, "", PRECISION_NONE
+        else:
+            kept_addr, coords, country, cp, best_dist = pick_site_with_indus_priority(
+                adresse, base_coords, row, resolve=resolve
+            )
+            # trajet déjà routé pour ce projet (run précédent, autre export) : repris tel quel
+            known = sm.lookup_distance(known_routes, coords, base_coords) if coords else None
+
+            if coords and not known and (budget or local):
+                dist, dist_type = None, ""
+                deferred.append((pos, h, kept_addr, coords, country, cp))
+            else:
+                if known:
+                    dist, dist_type = known
+                elif coords:
+                    dist, dist_type = distance_km(base_coords, coords, region_of(country, cp), estimator, cutoff_km)
+                    remember(coords, dist, dist_type)
+                else:
+                    dist = round(best_dist) if best_dist else None
+                    dist_type = ""
+                if checkpoint is not None:
+                    checkpoint.add(pos, kept_addr, coords, country, cp, dist, dist_type)
+
+        # le résultat vaut pour toutes les lignes du fournisseur
+        for member in members[h]:
+            _, mrow = rows[member]
+            mname = str(mrow.get("Raison sociale", "")).strip()
+            if coords:
+                chosen_coords[mname] = (coords[0], coords[1], country)
+            result["Raison sociale"][member] = mname
+            result["Pays"][member] = country
+            result["Adresse"][member] = kept_addr
+            result["Code postal"][member] = cp
+            result["Distance au projet"][member] = dist
+            result["Catégories"][member] = mrow.get("Catégories", "")
+            result["Référent MOA"][member] = mrow.get("Référent MOA", "")
+            result["Contact MOA"][member] = mrow.get("Contact MOA", "")
+            result["Type de distance"][member] = dist_type
+            result["Fiabilité géocode"][member] = precision
+            result["Latitude"][member] = coords[0] if coords else None
+            result["Longitude"][member] = coords[1] if coords else None
+        if not (deferred and deferred[-1][0] == pos):
+            done += len(members[h])
+        if progress is not None:
+            progress(done, n_rows)
+
+    for (h, _), (dist, dist_type) in zip(offline, offline_distances(base_coords, [o[1] for o in offline], estimator)):
+        for member in members[h]:
+            result["Distance au projet"][member] = dist
+            result["Type de distance"][member] = dist_type
+    if n_degraded:
+        notify(f"⏱️ Délai atteint : {n_degraded} fournisseur(s) approché(s) hors ligne "
+               f"(colonne « Fiabilité géocode »).", "warning")
+
+    if deferred:
+        geo = geodesic_km_many(base_coords, result["Latitude"], result["Longitude"])
+        # budget compté en fournisseurs : les doublons ne prennent pas de place dans le top N
+        is_lead = np.array([leaders[h] == pos for pos, h in enumerate(hashes)])
+        # les distances routières déjà connues ne consomment pas le budget mais comptent dans le top N
+        in_budget = routing_budget(np.where(is_lead, geo, np.nan), max_routes, radius_km)
+        # graphe local : une seule recherche depuis le projet pour tous les fournisseurs retenus
+        graph_km = {}
+        if local:
+            todo = [d for d in deferred if in_budget[d[0]]]
+            found = ROAD_GRAPH.distances_km(base_coords, [d[3] for d in todo])
+            graph_km = {d[0]: km for d, km in zip(todo, found) if km is not None}
+        n_routed = 0
+        late = []
+        for pos, h, kept_addr, coords, country, cp in deferred:
+            if pos in graph_km:
+                dist, dist_type = round(graph_km[pos], 1), "Graphe routier local"
+                if estimator is not None:
+                    estimator.learn(float(geo[pos]), graph_km[pos], region_of(country, cp))
+                n_routed += 1
+            elif in_budget[pos] and (t_end is None or time.monotonic() < t_end):
+                dist, dist_type = distance_km(base_coords, coords, region_of(country, cp), estimator, cutoff_km,
+                                              local_graph=not local)
+                n_routed += 1
+            elif in_budget[pos]:
+                # délai écoulé : distance sans réseau (lot ci-dessous), non mémorisée (le routage sera refait)
+                late.append((h, (coords, region_of(country, cp))))
+                continue
+            elif result["Type de distance"][pos] == ESTIMATE_TYPE:
+                # hors budget : l'estimation mémorisée vaut mieux que le vol d'oiseau
+                dist, dist_type = result["Distance au projet"][pos], ESTIMATE_TYPE
+            else:
+                dist, dist_type = round(float(geo[pos]), 1), "Vol d’oiseau"
+            for member in members[h]:
+                result["Distance au projet"][member] = dist
+                result["Type de distance"][member] = dist_type
+            remember(coords, dist, dist_type)
+            if checkpoint is not None:
+                checkpoint.add(pos, kept_addr, coords, country, cp, dist, dist_type)
+            done += len(members[h])
+            if progress is not None:
+                progress(done, n_rows)
+        for (h, _), (dist, dist_type) in zip(late, offline_distances(base_coords, [o[1] for o in late], estimator)):
+            for member in members[h]:
+                result["Distance au projet"][member] = dist
+                result["Type de distance"][member] = dist_type
+            done += len(members[h])
+        if late and progress is not None:
+            progress(done, n_rows)
+        if budget:
+            notify(f"🧭 Budget de routage : {n_routed} distance(s) routière(s), "
+                   f"{len(deferred) - n_routed} au vol d'oiseau.")
+
+    n_dups = n_rows - len(members)
+    if n_dups:
+        notify(f"🧬 {n_dups} ligne(s) en double (même fournisseur, mêmes sites) calculée(s) une seule fois.")
+    if n_hits:
+        notify(f"♻️ {n_hits} fournisseur(s) déjà calculé(s) (reprise), {len(members) - n_hits} à (re)calculer.")
+    if n_known:
+        notify(f"♻️ {n_known} site(s) déjà géocodé(s) (référentiel fournisseurs) : seuls le choix du site et la distance sont refaits.")
+    if master_path:
+        sm.merge_and_save(new_geocodes, new_routes, master_path)
+    estimator.save()
+    ladder = get_ladder_stats(LADDER_STATS_PATH)
+    ladder.save()
+    print(f"ℹ️ Géocodage : {ladder.calls_per_address():.2f} requête(s) par adresse en moyenne")
+
+    return typed_result_frame(result), base_coords, chosen_coords
+
+
+# ========================= EXCEL ============================
+def to_excel(df, template=TEMPLATE_PATH, start=START_ROW, map_image=None):
+    """
+    Excel complet : Adresse / CP séparés + Contact MOA e-mail.
+    map_image : PNG (BytesIO, cf. static_map.render_static_map) ajouté dans une feuille "Carte".
+    """
+    wb = load_workbook(template)
+    ws = wb.worksheets[0]
+    max_cols = 8
+    for r in range(start, ws.max_row+1):
+        for c in range(1, max_cols+1):
+            ws.cell(r, c, value=None)
+    for i, (_, r) in enumerate(df.iterrows(), start=start):
+        ws.cell(i,1, r.get("Raison sociale",""))
+        ws.cell(i,2, r.get("Pays",""))
+        ws.cell(i,3, r.get("Adresse",""))
+        ws.cell(i,4, r.get("Code postal",""))
+        dist = r.get("Distance au projet","")
+        ws.cell(i,5, None if pd.isna(dist) else dist)   # NaN -> cellule vide
+        ws.cell(i,6, r.get("Catégories",""))
+        ws.cell(i,7, r.get("Référent MOA",""))
+        ws.cell(i,8, r.get("Contact MOA",""))   # e-mail dans Excel
+        ws.cell(i,9, r.get("Type de distance",""))
+    if map_image is not None:
+        from openpyxl.drawing.image import Image as XLImage
+        ws_map = wb["Carte"] if "Carte" in wb.sheetnames else wb.create_sheet("Carte")
+        # copie : openpyxl ferme le flux de l'image à l'enregistrement (le PNG reste téléchargeable)
+        img = XLImage(BytesIO(map_image.getvalue()))
+        img.width, img.height = img.width // 2, img.height // 2
+        ws_map.add_image(img, "A1")
+    bio = BytesIO(); wb.save(bio); bio.seek(0); return bio
+
+def to_simple(df, template="doc_base_contact_simple.xlsx", start=11):
+    """
+    Génère le fichier 'contact simple' dans le modèle :
+    Colonnes :
+      A = Raison sociale
+      B = Référent MOA
+      C = Contact MOA
+      D = Catégories
+    Les lignes commencent à start (=11).
+    """
+
+    # ouverture modèle
+    wb = load_workbook(template)
+    ws = wb.active
+
+    # on efface d'anciennes valeurs
+    for r in range(start, ws.max_row + 1):
+        for c in range(1, 5):
+            ws.cell(r, c).value = None
+
+    # remplissage
+    for i, (_, row) in enumerate(df.iterrows(), start=start):
+        ws.cell(i, 1, row.get("Raison sociale", ""))
+        ws.cell(i, 2, row.get("Référent MOA", ""))
+        ws.cell(i, 3, row.get("Contact MOA", ""))
+        ws.cell(i, 4, row.get("Catégories", ""))
+
+    # export
+    bio = BytesIO()
+    wb.save(bio)
+    bio.seek(0)
+    return bio
+
+
+def to_category_workbook(df, index):
+    """Classeur avec une feuille "Tous" puis une feuille par catégorie (via l'index inversé)."""
+    bio = BytesIO()
+    with pd.ExcelWriter(bio, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False, sheet_name="Tous")
+        write_category_sheets(writer, df, index, reserved=["Tous"])
+    bio.seek(0)
+    return bio
+
+
+# ===================== PARQUET / FEATHER =====================
+def to_columnar(df, fmt="parquet"):
+    """
+    Même résultat que les Excel, en format colonne typé (relecture quasi
+    instantanée, zéro copie via Arrow) : distance et coordonnées en float64,
+    Pays / Catégories / Type de distance en catégoriel, texte en chaînes Arrow.
+    """
+    out = df.copy()
+    for c in NUMERIC_COLUMNS:
+        if c in out:
+            out[c] = pd.to_numeric(out[c], errors="coerce").astype("float64")
+    for c in CATEGORICAL_COLUMNS:
+        if c in out:
+            out[c] = out[c].astype("category")
+    for c in out.columns:
+        if out[c].dtype == object:
+            out[c] = out[c].astype(TEXT_DTYPE)
+    bio = BytesIO()
+    if fmt == "feather":
+        out.reset_index(drop=True).to_feather(bio)
+    else:
+        out.to_parquet(bio, index=False)
+    bio.seek(0)
+    return bio
+
+
+# ===================== CARTE (Folium) =======================
+def _row_point(r, coords_dict):
+    """(lat, lon, pays) d'une ligne : colonnes Latitude/Longitude, sinon coords_dict (par nom)."""
+    lat, lon = r.get("Latitude"), r.get("Longitude")
+    if lat is not None and lon is not None and not (pd.isna(lat) or pd.isna(lon)):
+        return float(lat), float(lon), r.get("Pays", "")
+    return coords_dict.get(r.get("Raison sociale", ""))
+
+def make_map(df, base_coords, coords_dict, base_address):
+    fmap = folium.Map(location=[46.6, 2.5], zoom_start=5, tiles="CartoDB positron", control_scale=True)
+    if base_coords:
+        folium.Marker(base_coords, icon=folium.Icon(color="red", icon="star"),
+                      popup=f"<b>Projet</b><br>{base_address}",
+                      tooltip="Projet").add_to(fmap)
+    seen = set()
+    for _, r in df.iterrows():
+        name = r.get("Raison sociale","")
+        c = _row_point(r, coords_dict)
+        if not c or (name, c[0], c[1]) in seen: continue
+        seen.add((name, c[0], c[1]))     # un marqueur par fournisseur et par site
+        lat, lon, country = c
+        addr = r.get("Adresse","")
+        cp = r.get("Code postal","")
+        folium.Marker([lat,lon],
+            icon=folium.Icon(color="blue", icon="industry", prefix="fa"),
+            popup=f"<b>{name}</b><br>{addr}<br>{cp or ''} — {country}",
+            tooltip=name).add_to(fmap)
+        folium.map.Marker(
+            [lat, lon],
+            icon=DivIcon(icon_size=(180,36), icon_anchor=(0,0),
+                         html=f'<div style="font-weight:600;color:#1f6feb;white-space:nowrap;'
+                              f'text-shadow:0 0 3px #fff;">{name}</div>')
+        ).add_to(fmap)
+    return fmap
+
+def map_to_html(fmap):
+    s = fmap.get_root().render().encode("utf-8")
+    bio = BytesIO(); bio.write(s); bio.seek(0); return bio
@@ -0,0 +1,98 @@
+"""
+Carte statique (PNG/SVG) rendue avec matplotlib, alternative légère à la carte
+Folium HTML : étoile du projet, fournisseurs en un seul appel scatter (couleur =
+distance), cercles de distance et étiquettes des fournisseurs les plus proches.
+N'utilise pas pyplot : aucune dépendance à un affichage, utilisable en headless.
+"""
+import math
+from io import BytesIO
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.patches import Circle
+
+KM_PER_DEG_LAT = 111.32
+RINGS_KM = (50, 100, 200, 500)
+PRIMARY = "#0b1d4f"
+
+
+def _points(df, coords_dict):
+    """
+    Noms, latitudes, longitudes des fournisseurs géocodés présents dans df
+    (colonnes Latitude/Longitude, à défaut coords_dict par nom), un point par site.
+    """
+    if "Raison sociale" not in df:
+        return [], np.empty(0), np.empty(0)
+    if "Latitude" in df and "Longitude" in df:
+        pts = df[["Raison sociale", "Latitude", "Longitude"]].dropna().drop_duplicates()
+        return (pts["Raison sociale"].astype(str).tolist(),
+                pts["Latitude"].to_numpy(dtype=float), pts["Longitude"].to_numpy(dtype=float))
+    names, lats, lons = [], [], []
+    for name in dict.fromkeys(df["Raison sociale"].tolist()):
+        c = coords_dict.get(name)
+        if not c:
+            continue
+        names.append(name)
+        lats.append(c[0])
+        lons.append(c[1])
+    return names, np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+
+
+def render_static_map(df, base_coords, coords_dict, base_address="", fmt="png",
+                      rings_km=RINGS_KM, max_labels=30, dpi=150, size=(10, 10)):
+    """
+    Rend la carte et renvoie un BytesIO (fmt="png" ou "svg").
+    Projection équirectangulaire centrée sur le projet (x = lon·cos(lat0)),
+    suffisante à l'échelle d'un pays ; les cercles sont donc de vrais cercles.
+    """
+    names, lats, lons = _points(df, coords_dict)
+    lat0 = base_coords[0] if base_coords else (float(lats.mean()) if len(lats) else 46.6)
+    kx = math.cos(math.radians(lat0))
+    xs, ys = lons * kx, lats
+
+    fig = Figure(figsize=size, dpi=dpi)
+    ax = fig.add_subplot(1, 1, 1)
+    ax.set_aspect("equal")
+    ax.set_facecolor("#f8f9fa")
+
+    if len(xs):
+        if base_coords:
+            bx, by = base_coords[1] * kx, base_coords[0]
+            dist = np.hypot(xs - bx, ys - by) * KM_PER_DEG_LAT
+        else:
+            dist = np.zeros(len(xs))
+        sc = ax.scatter(xs, ys, s=14, c=dist, cmap="viridis_r", edgecolors="white",
+                        linewidths=0.3, zorder=3)
+        if base_coords:
+            fig.colorbar(sc, ax=ax, shrink=0.6, label="Distance au projet (km, vol d'oiseau)")
+        # étiquettes : seulement les plus proches (le texte coûte bien plus cher que les points)
+        for i in np.argsort(dist, kind="stable")[:max_labels]:
+            ax.annotate(names[i], (xs[i], ys[i]), xytext=(3, 3), textcoords="offset points",
+                        fontsize=6, color="#1f6feb", zorder=4)
+
+    if base_coords:
+        bx, by = base_coords[1] * kx, base_coords[0]
+        for r in rings_km:
+            rad = r / KM_PER_DEG_LAT
+            ax.add_patch(Circle((bx, by), rad, fill=False, ls="--", lw=0.7, ec="#adb5bd", zorder=2))
+            ax.annotate(f"{r} km", (bx, by + rad), fontsize=6, color="#6c757d", ha="center", va="bottom")
+        ax.scatter([bx], [by], marker="*", s=260, c="red", edgecolors="white", zorder=5)
+        ax.annotate("Projet", (bx, by), xytext=(6, -10), textcoords="offset points",
+                    fontsize=8, fontweight="bold", color="red", zorder=5)
+
+    # emprise : fournisseurs + projet, avec une marge
+    all_x = np.append(xs, base_coords[1] * kx) if base_coords else xs
+    all_y = np.append(ys, base_coords[0]) if base_coords else ys
+    if len(all_x):
+        pad = max(0.3, 0.05 * max(np.ptp(all_x), np.ptp(all_y)))
+        ax.set_xlim(all_x.min() - pad, all_x.max() + pad)
+        ax.set_ylim(all_y.min() - pad, all_y.max() + pad)
+
+    ax.set_xticks([])
+    ax.set_yticks([])
+    ax.set_title(f"Sourcing MOA — {base_address}" if base_address else "Sourcing MOA", color=PRIMARY)
+
+    bio = BytesIO()
+    fig.savefig(bio, format=fmt, bbox_inches="tight")
+    bio.seek(0)
+    return bio
@@ -0,0 +1,202 @@
+"""
+Référentiel fournisseurs persistant (Parquet), indépendant du projet.
+
+Deux tables :
+
+    supplier_master.parquet              une ligne par adresse fournisseur normalisée :
+                                         coordonnées, pays, code postal
+    supplier_master_distances.parquet    distances routières déjà calculées (OSRM,
+                                         graphe local), par couple site / lieu du projet
+
+Une adresse déjà géocodée ne repasse plus par le géocodage, quel que soit le
+projet : pour chaque adresse de projet, seuls le choix du site (le plus proche)
+et la distance sont refaits, et la distance elle-même est reprise si ce trajet
+a déjà été routé. Deux projets n'invalident donc jamais leurs entrées.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+
+import pandas as pd
+
+GEOCODE_COLUMNS = ["Adresse normalisée", "Latitude", "Longitude", "Pays", "Code postal"]
+DISTANCE_COLUMNS = ["Trajet", "Distance au projet", "Type de distance"]
+NUMERIC_COLUMNS = ("Latitude", "Longitude", "Distance au projet")
+
+
+def _normalize(s) -> str:
+    s = unicodedata.normalize("NFKD", str(s or ""))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return re.sub(r"\s+", " ", s.lower()).strip()
+
+
+def supplier_key(name) -> str:
+    """Clé fournisseur : raison sociale sans accents, en minuscules, espaces compactés."""
+    return _normalize(name)
+
+
+def address_key(addr) -> str:
+    """Clé d'une adresse de site : sans accents, en minuscules, espaces et virgules compactés."""
+    return re.sub(r"\s*,\s*", ", ", _normalize(addr)).strip(" ,")
+
+
+def route_key(coords, base_coords) -> str:
+    """Clé d'un trajet : site (~1 m) et lieu du projet (arrondi à ~100 m)."""
+    return f"{coords[0]:.5f},{coords[1]:.5f}|{base_coords[0]:.3f},{base_coords[1]:.3f}"
+
+
+def site_columns(columns) -> list:
+    """Colonnes qui influencent le choix du site (adresse, implantations, siège)."""
+    cols = []
+    for c in columns:
+        cl = str(c).lower()
+        if cl == "adresse" or "implant" in cl or "siège" in cl or "siege" in cl:
+            cols.append(c)
+    return cols
+
+
+def normalized_addresses(row, site_cols) -> str:
+    parts = []
+    for c in site_cols:
+        v = row.get(c, "")
+        v = "" if v is None or (isinstance(v, float) and pd.isna(v)) else str(v)
+        v = re.sub(r"\s+", " ", v).strip().lower()
+        parts.append("" if v == "nan" else v)
+    return " | ".join(parts)
+
+
+def row_hash(name, addresses: str) -> str:
+    """Empreinte d'une ligne (fournisseur + sites) : les doublons d'un export sont calculés une fois."""
+    payload = "\x1f".join([supplier_key(name), addresses])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def distances_path(path) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}_distances{ext or '.parquet'}"
+
+
+def _empty(columns) -> pd.DataFrame:
+    return pd.DataFrame({c: pd.Series(dtype="object") for c in columns}).set_index(columns[0])
+
+
+def _read(path, columns) -> pd.DataFrame:
+    if not path or not os.path.exists(path):
+        return _empty(columns)
+    try:
+        t = pd.read_parquet(path)
+    except Exception as e:
+        print(f"⚠️ Référentiel fournisseurs illisible ({path}) : {e}")
+        return _empty(columns)
+    if columns == GEOCODE_COLUMNS and columns[0] not in t.columns and "Hash" in t.columns:
+        t = _from_hashed(t)
+    if not set(columns) <= set(t.columns):
+        print(f"⚠️ Référentiel fournisseurs au format inconnu ({path}) : ignoré")
+        return _empty(columns)
+    t = t[columns].set_index(columns[0])
+    return t[~t.index.duplicated(keep="last")]
+
+
+def _from_hashed(old: pd.DataFrame) -> pd.DataFrame:
+    """Ancien référentiel (une ligne par fournisseur et par projet) : on en garde les sites géocodés."""
+    old = old[old["Latitude"].notna() & old["Longitude"].notna()]
+    return pd.DataFrame({
+        "Adresse normalisée": old["Adresse"].map(address_key),
+        "Latitude": old["Latitude"], "Longitude": old["Longitude"],
+        "Pays": old["Pays"], "Code postal": old["Code postal"],
+    })
+
+
+def load_master(path) -> pd.DataFrame:
+    """Géocodes connus, indexés par adresse normalisée (vide si le fichier est absent ou illisible)."""
+    return _read(path, GEOCODE_COLUMNS)
+
+
+def load_distances(path) -> pd.DataFrame:
+    """Distances routières connues, indexées par trajet."""
+    return _read(distances_path(path) if path else None, DISTANCE_COLUMNS)
+
+
+def lookup(master: pd.DataFrame, addr):
+    """(lat, lon, pays, cp) si l'adresse est déjà géocodée, sinon None."""
+    k = address_key(addr)
+    if k not in master.index:
+        return None
+    r = master.loc[k]
+    return float(r["Latitude"]), float(r["Longitude"]), r["Pays"] or "", r["Code postal"] or ""
+
+
+def lookup_distance(distances: pd.DataFrame, coords, base_coords):
+    """(distance km, type) si ce trajet a déjà été routé, sinon None."""
+    k = route_key(coords, base_coords)
+    if k not in distances.index:
+        return None
+    r = distances.loc[k]
+    return float(r["Distance au projet"]), r["Type de distance"]
+
+
+def make_geocode(addr, lat, lon, country, cp) -> dict:
+    return {
+        "Adresse normalisée": address_key(addr), "Latitude": float(lat), "Longitude": float(lon),
+        "Pays": str(country or ""), "Code postal": str(cp or ""),
+    }
+
+
+def make_distance(coords, base_coords, dist, dist_type) -> dict:
+    return {
+        "Trajet": route_key(coords, base_coords),
+        "Distance au projet": float(dist), "Type de distance": str(dist_type),
+    }
+
+
+def update_master(table: pd.DataFrame, entries: list) -> pd.DataFrame:
+    """Ajoute les entrées (géocodes ou distances) ; une clé déjà présente prend la nouvelle valeur."""
+    columns = [table.index.name] + list(table.columns)
+    new = pd.DataFrame(entries, columns=columns).set_index(columns[0])
+    parts = [p for p in (table, new) if len(p)]
+    if not parts:
+        return _empty(columns)
+    merged = pd.concat(parts)
+    return merged[~merged.index.duplicated(keep="last")]
+
+
+_SAVE_LOCK = threading.Lock()     # sessions et tâches du même serveur écrivent les mêmes fichiers
+
+
+def save_master(table: pd.DataFrame, path):
+    """Écriture atomique (fichier temporaire propre à l'appel puis renommage)."""
+    if not path:
+        return
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    os.close(fd)
+    out = table.reset_index()
+    for c in out.columns:
+        if c in NUMERIC_COLUMNS:
+            out[c] = pd.to_numeric(out[c], errors="coerce")
+        else:
+            out[c] = out[c].fillna("").astype(str)
+    try:
+        out.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"⚠️ Référentiel fournisseurs non sauvegardé ({path}) : {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def merge_and_save(geocodes: list, distances: list, path):
+    """
+    Relit les deux tables sous verrou, y fusionne les nouvelles entrées puis les
+    écrit : les entrées d'une autre session sauvegardées entre-temps ne sont pas écrasées.
+    """
+    if not path:
+        return
+    with _SAVE_LOCK:
+        if geocodes:
+            save_master(update_master(load_master(path), geocodes), path)
+        if distances:
+            save_master(update_master(load_distances(path), distances), distances_path(path))